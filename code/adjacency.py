@@ -0,0 +1,164 @@
+"""
+adjacency.py
+------------
+Compact array-backed adjacency for the undirected checkins graph.
+
+Node ids (sparse user and venue ids) are remapped to dense indices
+0..n-1 in ascending id order. Neighbors of the node with index i are
+stored as a sorted int32 array indices[offsets[i]:offsets[i+1]], which
+takes a fraction of the memory of a dict of tuples and allows
+intersections to be counted on sorted arrays.
+
+CSRAdjacency can be passed to the heuristics in place of the neighbor
+dict from main.create_neighbor_dict(). WeightedAdjacency adds a weight to
+every edge, e.g. the number of checkins of a user at a venue.
+"""
+
+import numpy as np
+import loader
+
+
+class CSRAdjacency(object):
+
+    def __init__(self, node_ids, offsets, indices, degrees=None):
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.indices = indices
+        if degrees is None:
+            degrees = np.diff(offsets).astype(np.int32)
+        self.degrees = degrees
+
+    @classmethod
+    def from_edges(cls, src, dst, node_ids=None):
+        """
+        Build the adjacency of the undirected graph with edges (src[i], dst[i]).
+        Duplicate edges and self loops are dropped. node_ids may list extra
+        (isolated) nodes to include.
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        if node_ids is None:
+            node_ids = np.unique(np.concatenate((src, dst)))
+        else:
+            node_ids = np.unique(np.concatenate((np.asarray(node_ids, dtype=np.int64), src, dst)))
+        src = np.searchsorted(node_ids, src)
+        dst = np.searchsorted(node_ids, dst)
+        keep = src != dst
+        rows = np.concatenate((src[keep], dst[keep]))
+        cols = np.concatenate((dst[keep], src[keep]))
+        n = len(node_ids)
+        keys = np.unique(rows * n + cols)
+        rows, cols = keys // n, keys % n
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=offsets[1:])
+        return cls(node_ids, offsets, cols.astype(np.int32))
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Build the adjacency of a SNAP graph.
+        """
+        node_ids = np.array([node.GetId() for node in graph.Nodes()], dtype=np.int64)
+        src, dst = [], []
+        for EI in graph.Edges():
+            src.append(EI.GetSrcNId())
+            dst.append(EI.GetDstNId())
+        return cls.from_edges(src, dst, node_ids)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node_id):
+        i = np.searchsorted(self.node_ids, node_id)
+        return i < len(self.node_ids) and self.node_ids[i] == node_id
+
+    def __getitem__(self, node_id):
+        """
+        Neighbor ids of node_id, in ascending order.
+        """
+        return self.node_ids[self.neighbor_indices(self.index(node_id))]
+
+    def index(self, node_id):
+        return int(np.searchsorted(self.node_ids, node_id))
+
+    def neighbor_indices(self, i):
+        return self.indices[self.offsets[i]:self.offsets[i + 1]]
+
+    def degree(self, node_id):
+        return int(self.degrees[self.index(node_id)])
+
+    def intersect(self, a, b):
+        """
+        Sorted intersection of two sorted arrays of neighbor indices.
+        """
+        return np.intersect1d(a, b, assume_unique=True)
+
+    def count_common(self, x, y):
+        """
+        Number of common neighbors of node ids x and y.
+        """
+        a = self.neighbor_indices(self.index(x))
+        b = self.neighbor_indices(self.index(y))
+        return len(self.intersect(a, b))
+
+    def expand(self, indices):
+        """
+        Concatenated neighbor indices of every index in indices, with
+        repetitions (one entry per walk step).
+        """
+        return self.indices[self._entry_positions(indices)[0]]
+
+    def _entry_positions(self, indices):
+        """
+        Positions in self.indices of the neighbors of every index in
+        indices, and the number of neighbors of each.
+        """
+        indices = np.asarray(indices)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        total = lengths.sum()
+        if total == 0:
+            return np.zeros(0, dtype=np.int64), lengths
+        # Position of each output entry within its node's neighbor range
+        ends = np.cumsum(lengths)
+        within = np.arange(total) - np.repeat(ends - lengths, lengths)
+        return np.repeat(starts, lengths) + within, lengths
+
+
+class WeightedAdjacency(CSRAdjacency):
+    """
+    CSRAdjacency with the weight of every edge, aligned with indices, and
+    the strength (total edge weight) of every node.
+    """
+
+    def __init__(self, node_ids, offsets, indices, weights):
+        CSRAdjacency.__init__(self, node_ids, offsets, indices)
+        self.weights = weights
+        rows = np.repeat(np.arange(len(node_ids)), np.diff(offsets))
+        self.strengths = np.bincount(rows, weights=weights, minlength=len(node_ids))
+
+    @classmethod
+    def from_adjacency(cls, adjacency, src, dst, weights):
+        """
+        Weight the edges of adjacency by the weights of the edges (src[i],
+        dst[i]) from loader.aggregate_edges(); other edges weigh 1.
+        """
+        rows = np.repeat(adjacency.node_ids, np.diff(adjacency.offsets))
+        cols = adjacency.node_ids[adjacency.indices]
+        edge_weights = loader.lookup_weights(rows, cols, src, dst, weights)
+        return cls(adjacency.node_ids, adjacency.offsets, adjacency.indices, edge_weights)
+
+    def neighbor_weights(self, i):
+        return self.weights[self.offsets[i]:self.offsets[i + 1]]
+
+    def expand_weighted(self, indices, walks):
+        """
+        One step of weighted walks: given distinct node indices and the
+        total weight of the walks ending at each, return the same for the
+        walks one edge longer.
+        """
+        positions, lengths = self._entry_positions(indices)
+        nodes, inverse = np.unique(self.indices[positions], return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=np.repeat(walks, lengths) * self.weights[positions],
+                             minlength=len(nodes))
+        return nodes, totals
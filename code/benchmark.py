@@ -0,0 +1,209 @@
+"""
+benchmark.py
+------------
+Benchmark the heuristics and pipeline stages on synthetic bipartite graphs.
+
+A power-law user/venue graph of configurable size is generated (no
+dataset download needed) and each stage is timed: loading, holdout,
+building the neighbor structures, every function in heuristics.py (per
+pair on a sample of pairs, and in blocks through sparse_scoring), and
+validation. Each stage is run a second time under tracemalloc to record
+its peak memory. The results, with throughput in items per second, are
+written to a JSON report so runs can be compared across versions.
+
+Usage: python benchmark.py --users 2000 --venues 400 --edges 20000 --output report.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import scipy
+import scipy.sparse
+from scipy.sparse.csgraph import connected_components
+
+import adjacency
+import evaluation
+import heuristics
+import holdout
+import loader
+import sparse_scoring
+import topk
+
+
+HEURISTICS = [
+    heuristics.random_predictor,
+    heuristics.distance,
+    heuristics.num_common_neighbors_user,
+    heuristics.num_common_neighbors_venue,
+    heuristics.adamic_adar_user,
+    heuristics.adamic_adar_venue,
+    heuristics.preferential_attachment,
+    heuristics.katz,
+]
+
+
+def generate_graph(num_users, num_venues, num_edges, exponent=1.0, seed=0):
+    """
+    Random bipartite graph whose user and venue degrees follow a power law:
+    the i-th most popular node is picked with probability proportional to
+    i^-exponent. Returns (user ids, venue ids) arrays of distinct edges.
+    """
+    rng = np.random.RandomState(seed)
+    users = _power_law_choice(rng, num_users, num_edges, exponent) + 1
+    venues = _power_law_choice(rng, num_venues, num_edges, exponent) + loader.MAX_USER_ID + 1
+    pairs = np.unique(np.stack((users, venues), axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _power_law_choice(rng, n, size, exponent):
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -exponent
+    return rng.permutation(n)[rng.choice(n, size, p=weights / weights.sum())]
+
+
+def _in_largest_component(src, dst, mask):
+    """
+    Which edges have both endpoints in the largest connected component of
+    the graph made of the edges in mask.
+    """
+    adj = adjacency.CSRAdjacency.from_edges(src[mask], dst[mask])
+    n = len(adj.node_ids)
+    A = scipy.sparse.csr_matrix((np.ones(len(adj.indices)), adj.indices, adj.offsets), shape=(n, n))
+    labels = connected_components(A, directed=False)[1]
+    largest = adj.node_ids[labels == np.argmax(np.bincount(labels))]
+    return np.isin(src, largest) & np.isin(dst, largest)
+
+
+def measure(report, name, fn, num_items=None):
+    """
+    Run fn() once for timing and once under tracemalloc for peak memory,
+    record both in report['stages'][name] and return fn's result.
+    """
+    start = time.time()
+    result = fn()
+    seconds = time.time() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stage = {'seconds': seconds, 'peak_memory_bytes': peak}
+    if num_items is not None:
+        stage['items'] = num_items
+        stage['items_per_second'] = num_items / seconds if seconds > 0 else None
+    report['stages'][name] = stage
+    print('{0:45s} {1:8.3f}s {2:10.1f} MB'.format(name, seconds, peak / 1e6))
+    return result
+
+
+def run(num_users, num_venues, num_edges, exponent=1.0, seed=0, num_sample_pairs=2000,
+        block_size=128):
+    import snap
+    report = {
+        'config': {
+            'users': num_users, 'venues': num_venues, 'edges': num_edges,
+            'exponent': exponent, 'seed': seed, 'sample_pairs': num_sample_pairs,
+            'block_size': block_size,
+        },
+        'environment': {
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'scipy': scipy.__version__, 'platform': platform.platform(),
+        },
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'stages': {},
+    }
+    src, dst = generate_graph(num_users, num_venues, num_edges, exponent, seed)
+    report['graph'] = {'edges': len(src)}
+
+    # Loading
+    handle, edge_list = tempfile.mkstemp(suffix='.txt')
+    os.close(handle)
+    try:
+        np.savetxt(edge_list, np.stack((src, dst), axis=1), fmt='%d')
+        measure(report, 'load/snap.LoadEdgeList',
+                lambda: snap.LoadEdgeList(snap.PUNGraph, edge_list, 0, 1), len(src))
+        measure(report, 'load/loader.read_edge_list',
+                lambda: loader.read_edge_list(edge_list), len(src))
+    finally:
+        os.remove(edge_list)
+
+    # Holdout
+    folds = measure(report, 'holdout/assign_folds',
+                    lambda: holdout.assign_folds(src, dst, 1, 0.2, seed), len(src))
+    # The distance heuristic needs a connected training graph
+    train = (folds == holdout.TRAIN) & _in_largest_component(src, dst, folds == holdout.TRAIN)
+    graph = loader.build_graph(src[train], dst[train])
+    users = np.unique(src[train]).tolist()
+    venues = np.unique(dst[train]).tolist()
+    num_pairs = len(users) * len(venues)
+    report['graph'].update({'train_edges': int(train.sum()), 'users': len(users),
+                            'venues': len(venues), 'pairs': num_pairs})
+
+    # Neighbor structures
+    neighbor_dict = measure(report, 'build/CSRAdjacency.from_edges',
+                            lambda: adjacency.CSRAdjacency.from_edges(src[train], dst[train]),
+                            int(train.sum()))
+    matrix = measure(report, 'build/BipartiteMatrix.from_edges',
+                     lambda: sparse_scoring.BipartiteMatrix.from_edges(
+                         src[train], dst[train], users, venues), int(train.sum()))
+
+    # Heuristics, per pair on a sample and in blocks on all pairs
+    rng = np.random.RandomState(seed)
+    sample = [(users[i], venues[j]) for i, j in zip(
+        rng.randint(len(users), size=num_sample_pairs), rng.randint(len(venues), size=num_sample_pairs))]
+    k = topk.resolve_k(0.2, num_pairs)
+    for score_fn in HEURISTICS:
+        name = score_fn.__name__
+        measure(report, 'score/{}/per_pair'.format(name),
+                lambda: [score_fn(graph, u, v, neighbor_dict) for u, v in sample], len(sample))
+        if sparse_scoring.has_block_fn(score_fn):
+            scores = measure(report, 'score/{}/blocks'.format(name),
+                             lambda: _score_all(matrix, score_fn, k, block_size), num_pairs)
+
+    # Validation of the last ranking
+    test = folds != holdout.TRAIN
+    test_edges = np.stack((src[test], dst[test]), axis=1)
+    ranked_pairs = np.array([pair for pair, score in scores], dtype=np.int64)
+    ranked_scores = [score for pair, score in scores]
+    measure(report, 'validate/evaluate',
+            lambda: evaluation.evaluate(test_edges, ranked_pairs, ranked_scores, num_pairs),
+            len(ranked_scores))
+    return report
+
+
+def _score_all(matrix, score_fn, k, block_size):
+    selector = topk.TopKSelector(k)
+    for block_users, block in sparse_scoring.score_blocks(matrix, score_fn, block_size):
+        selector.push_block(block_users, matrix.venues, block)
+    return selector.result()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark link prediction on a synthetic graph.')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--venues', type=int, default=400)
+    parser.add_argument('--edges', type=int, default=20000)
+    parser.add_argument('--exponent', type=float, default=1.0,
+                        help='power-law exponent of the node popularity')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sample-pairs', type=int, default=2000,
+                        help='number of pairs scored one at a time per heuristic')
+    parser.add_argument('--block-size', type=int, default=128)
+    parser.add_argument('--output', default='benchmark_report.json')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = run(args.users, args.venues, args.edges, args.exponent, args.seed,
+                 args.sample_pairs, args.block_size)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print('Report written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+bfs.py
+------
+Bit-parallel multi-source BFS over the bipartite user-venue graph.
+
+Up to 64 source users are searched at once: every node carries a 64-bit
+mask of the sources that have reached it, and one BFS level is a
+bitwise OR of the neighbors' masks, computed for all nodes with
+np.bitwise_or.reduceat. This gives the distance from each source user
+to every venue with one pass over the edges per level, instead of one
+ring search per (user, venue) pair.
+"""
+
+import numpy as np
+
+NUM_BITS = 64
+
+
+def bipartite_distances(csr, csc, sources, max_depth=None):
+    """
+    Shortest path distances from each user row in sources (at most 64) to
+    every venue column of the biadjacency matrix, as a (len(sources) x
+    num_venues) float array. Venues farther than max_depth are set to
+    max_depth + 1, and unreachable venues to inf when max_depth is None.
+    """
+    assert len(sources) <= NUM_BITS
+    num_users, num_venues = csr.shape
+    unreached = np.inf if max_depth is None else max_depth + 1
+    distances = np.full((len(sources), num_venues), unreached)
+    user_frontier = np.zeros(num_users, dtype=np.uint64)
+    source_bits = np.left_shift(np.uint64(1), np.arange(len(sources), dtype=np.uint64))
+    np.bitwise_or.at(user_frontier, sources, source_bits)
+    visited_users = user_frontier.copy()
+    visited_venues = np.zeros(num_venues, dtype=np.uint64)
+    depth = 0
+    while max_depth is None or depth < max_depth:
+        # Venues are at odd distances from users
+        venue_frontier = _expand(user_frontier, csc.indptr, csc.indices) & ~visited_venues
+        depth += 1
+        if not venue_frontier.any():
+            break
+        visited_venues |= venue_frontier
+        distances[_unpack(venue_frontier, len(sources))] = depth
+        if max_depth is not None and depth + 1 >= max_depth:
+            break
+        user_frontier = _expand(venue_frontier, csr.indptr, csr.indices) & ~visited_users
+        depth += 1
+        if not user_frontier.any():
+            break
+        visited_users |= user_frontier
+    return distances
+
+
+def _expand(bits, indptr, indices):
+    """
+    out[j] = OR of bits[indices[indptr[j]:indptr[j+1]]], 0 for empty rows.
+    """
+    out = np.zeros(len(indptr) - 1, dtype=np.uint64)
+    nonempty = np.diff(indptr) > 0
+    if nonempty.any():
+        out[nonempty] = np.bitwise_or.reduceat(bits[indices], indptr[:-1][nonempty])
+    return out
+
+
+def _unpack(bits, num_sources):
+    """
+    Boolean (num_sources x len(bits)) array with [i, j] set if bit i of
+    bits[j] is set.
+    """
+    as_bytes = bits.astype('<u8').view(np.uint8).reshape(len(bits), 8)
+    return np.unpackbits(as_bytes, axis=1, bitorder='little')[:, :num_sources].T.astype(bool)
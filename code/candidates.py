@@ -0,0 +1,67 @@
+"""
+candidates.py
+-------------
+Candidate (user, venue) pairs within a hop radius.
+
+Common neighbors, Adamic/Adar and Katz up to length 3 are 0 for any venue
+more than 3 hops away from a user, so only pairs within the radius need
+to be scored. Venues at distance l from a user are the nonzeros of
+B (B^T B)^((l - 1) / 2), computed for blocks of users with boolean sparse
+products. An optional random sample of farther venues per user can be
+added so that the pruned region is still represented, e.g. for
+calibrating scores.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class CandidatePairs(object):
+
+    def __init__(self, matrix, radius=3, num_far=0, seed=None):
+        """
+        matrix is a sparse_scoring.BipartiteMatrix. num_far venues farther
+        than radius are sampled for every user.
+        """
+        self.matrix = matrix
+        self.radius = radius
+        self.num_far = num_far
+        self.seed = 0 if seed is None else seed
+
+    def block(self, rows):
+        """
+        Boolean (len(rows) x num_venues) CSR matrix of the candidate venues
+        of the given user rows.
+        """
+        B = self.matrix.csr
+        reach = B[rows].astype(bool)
+        for path_length in range(3, self.radius + 1, 2):
+            reach = reach + ((reach * B.T) * B).astype(bool)
+        reach = sp.csr_matrix(reach, dtype=bool)
+        if self.num_far > 0:
+            reach = reach + self._sample_far(rows, reach)
+        reach.sort_indices()
+        return reach
+
+    def _sample_far(self, rows, reach):
+        """
+        Up to num_far random venues per row that are not in reach. Each
+        row has its own seeded generator, so the sample does not depend on
+        how users are split into blocks or shards.
+        """
+        num_venues = self.matrix.num_venues
+        sample_rows, sample_cols = [], []
+        for i, row in enumerate(rows):
+            near = reach.indices[reach.indptr[i]:reach.indptr[i + 1]]
+            num_far = min(self.num_far, num_venues - len(near))
+            if num_far <= 0:
+                continue
+            rng = np.random.RandomState([self.seed, int(row)])
+            far = np.setdiff1d(np.arange(num_venues), near, assume_unique=True)
+            sample_cols.append(rng.choice(far, num_far, replace=False))
+            sample_rows.append(np.full(num_far, i))
+        if not sample_cols:
+            return sp.csr_matrix(reach.shape, dtype=bool)
+        data = np.ones(sum(len(c) for c in sample_cols), dtype=bool)
+        return sp.csr_matrix((data, (np.concatenate(sample_rows), np.concatenate(sample_cols))),
+                             shape=reach.shape)
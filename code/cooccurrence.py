@@ -0,0 +1,128 @@
+"""
+cooccurrence.py
+---------------
+Precomputed two-hop index for the max-over-neighbors heuristics.
+
+For every pair of nodes (x, x_i) on the same side of the bipartite graph,
+the index stores |N(x) intersect N(x_i)| and the Adamic/Adar weight of
+that intersection. These are the entries of A^2 and A diag(w) A, where A
+is the adjacency matrix and w[z] = 1 / log(degree(z)). The common
+neighbor and Adamic/Adar heuristics then become an indexed max over the
+row of x instead of one set intersection per neighbor.
+
+The index holds O(sum of squared degrees) entries, so it is built once per
+training graph and saved to disk.
+"""
+
+import os
+import numpy as np
+import scipy.sparse as sp
+from adjacency import CSRAdjacency
+
+
+class CooccurrenceIndex(CSRAdjacency):
+    """
+    CSRAdjacency extended with two-hop co-occurrence counts and weights.
+    It can be passed to the heuristics anywhere a CSRAdjacency is accepted.
+    """
+
+    def __init__(self, node_ids, offsets, indices, counts=None, weights=None):
+        CSRAdjacency.__init__(self, node_ids, offsets, indices)
+        if counts is None:
+            counts, weights = self._build()
+        self.counts = counts
+        self.weights = weights
+
+    @classmethod
+    def from_adjacency(cls, adjacency):
+        return cls(adjacency.node_ids, adjacency.offsets, adjacency.indices)
+
+    def _build(self):
+        n = len(self.node_ids)
+        A = sp.csr_matrix((np.ones(len(self.indices)), self.indices, self.offsets), shape=(n, n))
+        w = np.zeros(n)
+        mask = self.degrees > 1
+        w[mask] = 1.0 / np.log(self.degrees[mask])
+        counts = (A * A).tocsr()
+        weights = (A * sp.diags(w) * A).tocsr()
+        counts.sort_indices()
+        weights.sort_indices()
+        counts.data = counts.data.astype(np.int32)
+        return counts, weights
+
+    def save(self, filename):
+        with open(filename, 'wb') as file:
+            np.savez(file,
+                     node_ids=self.node_ids, offsets=self.offsets, indices=self.indices,
+                     count_indptr=self.counts.indptr, count_indices=self.counts.indices,
+                     count_data=self.counts.data,
+                     weight_indptr=self.weights.indptr, weight_indices=self.weights.indices,
+                     weight_data=self.weights.data)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        n = len(data['node_ids'])
+        counts = sp.csr_matrix((data['count_data'], data['count_indices'],
+                                data['count_indptr']), shape=(n, n))
+        weights = sp.csr_matrix((data['weight_data'], data['weight_indices'],
+                                 data['weight_indptr']), shape=(n, n))
+        return cls(data['node_ids'], data['offsets'], data['indices'], counts, weights)
+
+    def matches(self, adjacency):
+        """
+        Whether this index was built from the same graph as adjacency.
+        """
+        return (np.array_equal(self.node_ids, adjacency.node_ids)
+                and np.array_equal(self.offsets, adjacency.offsets)
+                and np.array_equal(self.indices, adjacency.indices))
+
+    def max_common(self, x, y):
+        """
+        max(N(x) intersect N(x_i)) for all x_i in N(y)
+        """
+        counts = _row_lookup(self.counts, self.index(x), self.neighbor_indices(self.index(y)))
+        return int(counts.max()) if len(counts) > 0 else 0
+
+    def max_common_weight(self, x, y):
+        """
+        Adamic/Adar weight of N(x) intersect N(x_i) for the first x_i in
+        N(y) with the largest intersection, or 0 if all are empty.
+        """
+        x = self.index(x)
+        neighbors = self.neighbor_indices(self.index(y))
+        counts = _row_lookup(self.counts, x, neighbors)
+        if len(counts) == 0 or counts.max() == 0:
+            return 0
+        best = neighbors[np.argmax(counts):][:1]
+        return float(_row_lookup(self.weights, x, best)[0])
+
+
+def load_or_build(filename, adjacency):
+    """
+    Load the index saved at filename if it was built from the same graph
+    as adjacency, otherwise build it and save it there.
+    """
+    if os.path.exists(filename):
+        index = CooccurrenceIndex.load(filename)
+        if index.matches(adjacency):
+            print('Loaded two-hop index from {}'.format(filename))
+            return index
+    print('Building two-hop index...')
+    index = CooccurrenceIndex.from_adjacency(adjacency)
+    index.save(filename)
+    return index
+
+
+def _row_lookup(matrix, row, cols):
+    """
+    matrix[row, cols] for a CSR matrix with sorted indices, 0 where absent.
+    """
+    lo, hi = matrix.indptr[row], matrix.indptr[row + 1]
+    row_cols = matrix.indices[lo:hi]
+    pos = np.searchsorted(row_cols, cols)
+    found = pos < len(row_cols)
+    found[found] = row_cols[pos[found]] == cols[found]
+    values = np.zeros(len(cols), dtype=matrix.data.dtype)
+    values[found] = matrix.data[lo + pos[found]]
+    return values
@@ -0,0 +1,101 @@
+"""
+dataset_cache.py
+----------------
+Binary on-disk format for a processed checkins graph.
+
+A dataset is a directory of .npy files written once by the preprocessing
+step (processCheckIns.py):
+
+    edge_users.npy, edge_venues.npy   one entry per distinct edge
+    node_ids.npy                      sorted node ids (dense id map)
+    offsets.npy, indices.npy          CSR adjacency over dense indices
+    degrees.npy                       degree of every node
+    user_ids.npy, venue_ids.npy       sorted user and venue ids
+    edge_weights.npy                  number of checkins of every edge
+    meta.json                         format version and counts
+
+Datasets written before edge_weights.npy was added load with
+edge_weights = None.
+
+open_dataset() maps the files with numpy.memmap instead of reading them,
+so opening is near-instant and worker processes share the same pages.
+"""
+
+import json
+import os
+import numpy as np
+from adjacency import CSRAdjacency
+from loader import MAX_USER_ID
+
+FORMAT_VERSION = 1
+ARRAYS = ['edge_users', 'edge_venues', 'node_ids', 'offsets', 'indices', 'degrees',
+          'user_ids', 'venue_ids', 'edge_weights']
+OPTIONAL_ARRAYS = ['edge_weights']
+
+
+def write_dataset(directory, src, dst, max_user_id=MAX_USER_ID, weights=None):
+    """
+    Write the undirected graph with edges (src[i], dst[i]) to directory.
+    Ids up to max_user_id are users, larger ids are venues. The weight of
+    an edge is the sum of weights (1 by default) over its repeats, e.g.
+    its number of checkins.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    edge_users = np.where(src <= max_user_id, src, dst)
+    edge_venues = np.where(src <= max_user_id, dst, src)
+    keys, inverse = np.unique(np.stack((edge_users, edge_venues), axis=1), axis=0,
+                              return_inverse=True)
+    edge_weights = np.bincount(inverse.ravel(), weights=weights, minlength=len(keys))
+    adjacency = CSRAdjacency.from_edges(keys[:, 0], keys[:, 1])
+    node_ids = adjacency.node_ids
+    arrays = {
+        'edge_users': keys[:, 0],
+        'edge_venues': keys[:, 1],
+        'node_ids': node_ids,
+        'offsets': adjacency.offsets,
+        'indices': adjacency.indices,
+        'degrees': adjacency.degrees,
+        'user_ids': node_ids[node_ids <= max_user_id],
+        'venue_ids': node_ids[node_ids > max_user_id],
+        'edge_weights': edge_weights,
+    }
+    for name in ARRAYS:
+        np.save(os.path.join(directory, name + '.npy'), arrays[name])
+    meta = {
+        'version': FORMAT_VERSION,
+        'max_user_id': max_user_id,
+        'num_nodes': len(node_ids),
+        'num_edges': len(keys),
+        'num_users': len(arrays['user_ids']),
+        'num_venues': len(arrays['venue_ids']),
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w') as file:
+        json.dump(meta, file, indent=2)
+
+
+class Dataset(object):
+    """
+    Read-only, memory-mapped view of a dataset directory. Every name in
+    ARRAYS is available as an attribute.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as file:
+            self.meta = json.load(file)
+        assert self.meta['version'] == FORMAT_VERSION
+        for name in ARRAYS:
+            filename = os.path.join(directory, name + '.npy')
+            if name in OPTIONAL_ARRAYS and not os.path.exists(filename):
+                setattr(self, name, None)
+                continue
+            setattr(self, name, np.load(filename, mmap_mode='r'))
+
+    def adjacency(self):
+        return CSRAdjacency(self.node_ids, self.offsets, self.indices, self.degrees)
+
+
+def open_dataset(directory):
+    return Dataset(directory)
@@ -0,0 +1,90 @@
+"""
+evaluation.py
+-------------
+Vectorized evaluation of a ranked list of predicted (user, venue) pairs
+against the held-out test edges.
+
+Pairs are packed into 64-bit keys and looked up in the sorted test keys
+with np.searchsorted, so the hits of the whole ranking are found at once.
+Precision@K and recall@K for every cutoff, average precision and AUC are
+then computed from the cumulative hit counts in the same pass.
+"""
+
+import numpy as np
+from scipy.stats import rankdata
+
+
+def pack_pairs(x, y):
+    """
+    64-bit key of each undirected pair (x[i], y[i]), independent of order.
+    Node ids must be below 2^32.
+    """
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    return (np.minimum(x, y) << 32) | np.maximum(x, y)
+
+
+def find_hits(test_keys, keys):
+    """
+    Boolean array telling which keys are in test_keys, which must be sorted.
+    """
+    if len(test_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    pos = np.searchsorted(test_keys, keys)
+    pos[pos == len(test_keys)] = 0
+    return test_keys[pos] == keys
+
+
+def evaluate(test_edges, ranked_pairs, scores, num_pairs=None, cutoffs=None):
+    """
+    Evaluate a ranking given as an (n x 2) array of pairs sorted by
+    decreasing score. num_pairs is the total number of candidate pairs;
+    pairs missing from the ranking are treated as tied below it when
+    computing AUC. cutoffs defaults to 20 evenly spaced list positions.
+
+    Returns a dict with the TP/FP/FN counts of the whole list, the
+    precision@K and recall@K curves, average precision and AUC.
+    """
+    test_keys = np.unique(pack_pairs(*np.asarray(test_edges, dtype=np.int64).reshape(-1, 2).T))
+    ranked_pairs = np.asarray(ranked_pairs, dtype=np.int64).reshape(-1, 2)
+    scores = np.asarray(scores, dtype=np.float64)
+    num_test = len(test_keys)
+    num_ranked = len(scores)
+    num_pairs = num_ranked if num_pairs is None else num_pairs
+    hits = find_hits(test_keys, pack_pairs(ranked_pairs[:, 0], ranked_pairs[:, 1]))
+    cum_hits = np.cumsum(hits)
+    num_hits = int(cum_hits[-1]) if num_ranked > 0 else 0
+
+    if cutoffs is None:
+        cutoffs = np.unique(np.linspace(1, num_ranked, 20).astype(np.int64)) if num_ranked else []
+    cutoffs = np.asarray(cutoffs, dtype=np.int64)
+    hits_at = cum_hits[cutoffs - 1] if len(cutoffs) else np.zeros(0)
+    ranks = np.arange(1, num_ranked + 1)
+    precision_at_hits = cum_hits[hits] / ranks[hits].astype(np.float64)
+
+    return {
+        'TP': num_hits,
+        'FP': num_ranked - num_hits,
+        'FN': num_test - num_hits,
+        'num_test': num_test,
+        'cutoffs': cutoffs.tolist(),
+        'precision_at': (hits_at / np.maximum(cutoffs, 1).astype(np.float64)).tolist(),
+        'recall_at': (hits_at / float(max(num_test, 1))).tolist(),
+        'average_precision': float(precision_at_hits.sum() / max(num_test, 1)),
+        'auc': _auc(scores, hits, num_test, num_pairs),
+    }
+
+
+def _auc(scores, hits, num_test, num_pairs):
+    """
+    Mann-Whitney AUC with average ranks for ties. The num_pairs - len(scores)
+    unranked pairs form one tied group below every ranked pair.
+    """
+    num_negative = num_pairs - num_test
+    if num_test == 0 or num_negative <= 0:
+        return float('nan')
+    num_unranked = num_pairs - len(scores)
+    rank_sum = rankdata(scores)[hits].sum() + num_unranked * hits.sum()
+    unranked_hits = num_test - hits.sum()
+    rank_sum += unranked_hits * (num_unranked + 1) / 2.0
+    return float((rank_sum - num_test * (num_test + 1) / 2.0) / (num_test * float(num_negative)))
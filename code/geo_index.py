@@ -0,0 +1,133 @@
+"""
+geo_index.py
+------------
+Venue coordinates for distance-aware candidate pruning and scoring.
+
+Venue latitudes and longitudes (venues.tsv written by
+other/processDataset.py, see loader.read_venue_locations()) are stored as
+unit vectors on the sphere, where the great-circle distance between two
+points is 2R arcsin(|p - q| / 2) and the centroid of a user's checkins is
+the normalized mean of the vectors of their venues.
+
+GeoAdjacency is the CSRAdjacency of the checkins graph with the venue
+locations, for the per-pair geo_distance heuristic. GeoCandidates keeps a
+k-d tree of the venue vectors and restricts the candidate venues of each
+user to a radius around their checkin centroid; its block() has the same
+interface as candidates.CandidatePairs.block().
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+from adjacency import CSRAdjacency
+import id_sets
+
+EARTH_RADIUS_KM = 6371.0
+# Distance given to venues or users without coordinates (antipodal points)
+MAX_DISTANCE_KM = np.pi * EARTH_RADIUS_KM
+
+
+class VenueLocations(object):
+
+    def __init__(self, venue_ids, latitudes, longitudes):
+        venue_ids = np.asarray(venue_ids, dtype=np.int64)
+        order = np.argsort(venue_ids, kind='mergesort')
+        self.venue_ids = venue_ids[order]
+        self.vectors = unit_vectors(np.asarray(latitudes)[order], np.asarray(longitudes)[order])
+
+    def points(self, venue_ids):
+        """
+        (len(venue_ids) x 3) unit vectors of venue_ids, zero for venues
+        without coordinates.
+        """
+        venue_ids = np.asarray(venue_ids, dtype=np.int64)
+        points = np.zeros((len(venue_ids), 3))
+        found = id_sets.contains(self.venue_ids, venue_ids)
+        points[found] = self.vectors[np.searchsorted(self.venue_ids, venue_ids[found])]
+        return points
+
+    def centroid(self, venue_ids):
+        """
+        Unit vector of the centroid of venue_ids, zero if none of them has
+        coordinates.
+        """
+        return normalize(self.points(venue_ids).sum(axis=0, keepdims=True))[0]
+
+
+class GeoAdjacency(CSRAdjacency):
+
+    def __init__(self, node_ids, offsets, indices, locations):
+        CSRAdjacency.__init__(self, node_ids, offsets, indices)
+        self.locations = locations
+
+    @classmethod
+    def from_adjacency(cls, adjacency, locations):
+        return cls(adjacency.node_ids, adjacency.offsets, adjacency.indices, locations)
+
+
+class GeoCandidates(object):
+
+    def __init__(self, matrix, radius_km):
+        """
+        matrix is a sparse_scoring.BipartiteMatrix with locations set, see
+        BipartiteMatrix.set_locations().
+        """
+        self.matrix = matrix
+        self.radius_km = radius_km
+        self.located = np.flatnonzero(matrix.venue_points.any(axis=1))
+        self.tree = cKDTree(matrix.venue_points[self.located])
+
+    def block(self, rows):
+        """
+        Boolean (len(rows) x num_venues) CSR matrix of the venues visited
+        by the given user rows and the venues within radius_km of their
+        checkin centroids.
+        """
+        visits = self.matrix.csr[rows]
+        centroids = user_centroids(self.matrix, rows)
+        has_centroid = np.flatnonzero(centroids.any(axis=1))
+        chord = 2 * np.sin(min(self.radius_km / EARTH_RADIUS_KM, np.pi) / 2)
+        near = self.tree.query_ball_point(centroids[has_centroid], chord) if len(has_centroid) else []
+        lengths = np.array([len(venues) for venues in near], dtype=np.int64)
+        near_cols = np.concatenate([np.zeros(0, dtype=np.int64)] + [np.asarray(v, dtype=np.int64) for v in near])
+        result_rows = np.concatenate((np.repeat(np.arange(len(rows)), np.diff(visits.indptr)),
+                                      np.repeat(has_centroid, lengths)))
+        result_cols = np.concatenate((visits.indices, self.located[near_cols]))
+        reach = sp.csr_matrix((np.ones(len(result_rows), dtype=bool), (result_rows, result_cols)),
+                              shape=(len(rows), self.matrix.num_venues))
+        reach.sum_duplicates()
+        reach.sort_indices()
+        return reach
+
+
+def unit_vectors(latitudes, longitudes):
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.stack((np.cos(latitudes) * np.cos(longitudes),
+                     np.cos(latitudes) * np.sin(longitudes),
+                     np.sin(latitudes)), axis=1)
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def user_centroids(matrix, rows):
+    """
+    (len(rows) x 3) checkin centroids of the given user rows of a
+    BipartiteMatrix with locations, zero for users without located venues.
+    """
+    return normalize(matrix.csr[rows] * matrix.venue_points)
+
+
+def distances_km(points, other):
+    """
+    (len(points) x len(other)) great-circle distances between two arrays
+    of unit vectors, MAX_DISTANCE_KM where either vector is zero.
+    """
+    chords = np.sqrt(np.maximum(2 - 2 * points.dot(other.T), 0))
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chords / 2, 1))
+    missing = ~points.any(axis=1)[:, None] | ~other.any(axis=1)[None, :]
+    distances[missing] = MAX_DISTANCE_KM
+    return distances
@@ -0,0 +1,102 @@
+"""
+hetero_graph.py
+---------------
+Checkins, friendships and venue ratings in one typed adjacency store.
+
+HeteroAdjacency is the CSRAdjacency of the checkins graph, so it can be
+passed to every heuristic as the neighbor dict, with two more CSR
+relations over the same node ids:
+
+    friends    user -> sorted friend user ids (a CSRAdjacency)
+    ratings    venue -> sorted ids of the users who rated it, and their
+               ratings (rated_venues, rating_offsets, raters, rating_values)
+
+The friend_* heuristics use them per pair, and
+BipartiteMatrix.add_relations() turns them into sparse matrices so that
+the same scores are computed for blocks of users as sparse products,
+e.g. F[rows] * B for the number of friends who checked in at each venue.
+
+Friendships and ratings are read from socialgraph.tsv and ratings.tsv
+written by other/processDataset.py, see loader.read_social_graph() and
+loader.read_ratings().
+"""
+
+import numpy as np
+from adjacency import CSRAdjacency
+import id_sets
+
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class HeteroAdjacency(CSRAdjacency):
+
+    def __init__(self, node_ids, offsets, indices, friends, rated_venues, rating_offsets,
+                 raters, rating_values):
+        CSRAdjacency.__init__(self, node_ids, offsets, indices)
+        self.friends = friends
+        self.rated_venues = rated_venues
+        self.rating_offsets = rating_offsets
+        self.raters = raters
+        self.rating_values = rating_values
+
+    @classmethod
+    def from_adjacency(cls, adjacency, user_ids, friend_src=EMPTY, friend_dst=EMPTY,
+                       rating_users=EMPTY, rating_venues=EMPTY, rating_values=EMPTY):
+        """
+        Add friendships and ratings to the checkins adjacency. Only
+        friendships between users in user_ids (the users of the checkins
+        graph) and ratings of venues of the checkins graph by those users
+        are kept. Repeated ratings of a venue by a user are averaged.
+        """
+        user_ids = id_sets.to_id_array(user_ids)
+        friend_src = np.asarray(friend_src, dtype=np.int64)
+        friend_dst = np.asarray(friend_dst, dtype=np.int64)
+        keep = id_sets.contains(user_ids, friend_src) & id_sets.contains(user_ids, friend_dst)
+        friends = CSRAdjacency.from_edges(friend_src[keep], friend_dst[keep])
+
+        rating_users = np.asarray(rating_users, dtype=np.int64)
+        rating_venues = np.asarray(rating_venues, dtype=np.int64)
+        rating_values = np.asarray(rating_values, dtype=np.float64)
+        venue_ids = adjacency.node_ids[~id_sets.contains(user_ids, adjacency.node_ids)]
+        keep = id_sets.contains(user_ids, rating_users) & id_sets.contains(venue_ids, rating_venues)
+        pairs, inverse = np.unique(np.stack((rating_venues[keep], rating_users[keep]), axis=1),
+                                   axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        totals = np.bincount(inverse, weights=rating_values[keep], minlength=len(pairs))
+        counts = np.bincount(inverse, minlength=len(pairs))
+        rated_venues, starts = np.unique(pairs[:, 0], return_index=True)
+        rating_offsets = np.append(starts, len(pairs)).astype(np.int64)
+        return cls(adjacency.node_ids, adjacency.offsets, adjacency.indices, friends,
+                   rated_venues, rating_offsets, pairs[:, 1], totals / np.maximum(counts, 1))
+
+    def friends_of(self, user):
+        """
+        Sorted friend ids of user.
+        """
+        if user not in self.friends:
+            return EMPTY
+        return self.friends[user]
+
+    def raters_of(self, venue):
+        """
+        Sorted ids of the users who rated venue, and their ratings.
+        """
+        i = np.searchsorted(self.rated_venues, venue)
+        if i == len(self.rated_venues) or self.rated_venues[i] != venue:
+            return EMPTY, np.zeros(0)
+        start, end = self.rating_offsets[i], self.rating_offsets[i + 1]
+        return self.raters[start:end], self.rating_values[start:end]
+
+    def friend_edges(self):
+        """
+        (user ids, friend ids) of every friendship, in both directions.
+        """
+        friends = self.friends
+        return np.repeat(friends.node_ids, np.diff(friends.offsets)), friends.node_ids[friends.indices]
+
+    def rating_edges(self):
+        """
+        (user ids, venue ids, ratings) of every rating.
+        """
+        venues = np.repeat(self.rated_venues, np.diff(self.rating_offsets))
+        return self.raters, venues, self.rating_values
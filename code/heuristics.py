@@ -2,31 +2,56 @@
 heuristics.py
 -------------
 Contains various similarity metrics used in link prediction.
+
+neighbor_dict is either the dict of neighbor tuples built by
+main.create_neighbor_dict() or an adjacency.CSRAdjacency. The common
+neighbor and Adamic/Adar heuristics answer by lookup when given a
+cooccurrence.CooccurrenceIndex, and return estimates when given a
+minhash.MinHashIndex. The friend_* heuristics need the
+friendships and ratings of a hetero_graph.HeteroAdjacency, and the
+weighted_* heuristics the edge weights of an adjacency.WeightedAdjacency.
+geo_distance needs the venue locations of a geo_index.GeoAdjacency.
 """
 
 import snap
-import random
+import numpy as np
+from adjacency import CSRAdjacency
+from cooccurrence import CooccurrenceIndex
+import geo_index
+from minhash import MinHashIndex
+import id_sets
+import loader
 from collections import Counter
 from math import log
 
-def random_predictor(graph, x, y, neighbor_dict):
+# Indexes answering max_common() and max_common_weight() directly
+PAIR_INDEXES = (CooccurrenceIndex, MinHashIndex)
+
+def random_predictor(graph, x, y, neighbor_dict, seed=0):
     """
-    Random predictor
+    Random predictor. As in sparse_scoring.random_block(), user x gets a
+    row of scores over the venues in id order, seeded by (seed, x).
     """
-    return random.choice([0, 1])
+    num_users = int(np.searchsorted(neighbor_dict.node_ids, loader.MAX_USER_ID, 'right'))
+    col = neighbor_dict.index(y) - num_users
+    # Values are drawn in order, so the first col + 1 end with the score of y
+    return int(np.random.RandomState([seed, x]).randint(0, 2, size=col + 1)[col])
 
-def distance(graph, x, y, neighbor_dict):
+def distance(graph, x, y, neighbor_dict, max_depth=None):
     """
     Negative of the shortest path distance from x to y.
 
     We exploit the small-world property of the social network and apply
     expanded ring search to compute the shortest path distance from
-    x to y efficiently.
+    x to y efficiently. Pairs farther apart than max_depth score
+    -(max_depth + 1).
     """
-    assert(snap.IsConnected(graph))
+    assert(_is_connected(graph))
     S, D = set([x]), set([y])
     num_steps = 0
     while len(S.intersection(D)) == 0:
+        if max_depth is not None and num_steps == max_depth:
+            return (max_depth + 1) * -1
         smaller_set = S if len(S) < len(D) else D
         new_nodes = set()
         for node in smaller_set:
@@ -43,11 +68,12 @@ def num_common_neighbors_user(graph, user, venue, neighbor_dict):
     max(N(user) intersect N(user_i)) for all user_i in N(venue)
     where N(x) means neighbors of x.
     """
-    s1 = set(neighbor_dict[user])
+    if isinstance(neighbor_dict, PAIR_INDEXES):
+        return neighbor_dict.max_common(user, venue)
+    s1 = _neighbor_set(neighbor_dict, user)
     max_score = 0
     for user_i in neighbor_dict[venue]:
-        s2 = set(neighbor_dict[user_i])
-        score = len(s1.intersection(s2))
+        score = len(_intersection(neighbor_dict, s1, user_i))
         max_score = max(score, max_score)
     return max_score
 
@@ -57,11 +83,12 @@ def num_common_neighbors_venue(graph, user, venue, neighbor_dict):
     max(N(venue) intersect N(venue_i)) for all venue_i in N(user)
     where N(x) means neighbors of x.
     """
-    s1 = set(neighbor_dict[venue])
+    if isinstance(neighbor_dict, PAIR_INDEXES):
+        return neighbor_dict.max_common(venue, user)
+    s1 = _neighbor_set(neighbor_dict, venue)
     max_score = 0
     for venue_i in neighbor_dict[user]:
-        s2 = set(neighbor_dict[venue_i])
-        score = len(s1.intersection(s2))
+        score = len(_intersection(neighbor_dict, s1, venue_i))
         max_score = max(score, max_score)
     return max_score
 
@@ -70,59 +97,55 @@ def adamic_adar_user(graph, user, venue, neighbor_dict):
     """
     Weighted common neighbors
     """
-    s1 = set(neighbor_dict[user])
-    max_intersect = set()
+    if isinstance(neighbor_dict, PAIR_INDEXES):
+        return neighbor_dict.max_common_weight(user, venue)
+    s1 = _neighbor_set(neighbor_dict, user)
+    max_intersect = ()
     for user_i in neighbor_dict[venue]:
-        s2 = set(neighbor_dict[user_i])
-        intersect = s1.intersection(s2)
+        intersect = _intersection(neighbor_dict, s1, user_i)
         if len(intersect) > len(max_intersect):
             max_intersect = intersect
-    weighted_score = 0
-    for z in max_intersect:
-        degree = graph.GetNI(z).GetDeg()
-        if degree > 1:
-            weighted_score += 1.0 / log(degree)
-    return weighted_score
+    return _adamic_adar_sum(graph, neighbor_dict, max_intersect)
 
 
 def adamic_adar_venue(graph, user, venue, neighbor_dict):
     """
     Weighted common neighbors
     """
-    s1 = set(neighbor_dict[venue])
-    max_intersect = set()
+    if isinstance(neighbor_dict, PAIR_INDEXES):
+        return neighbor_dict.max_common_weight(venue, user)
+    s1 = _neighbor_set(neighbor_dict, venue)
+    max_intersect = ()
     for venue_i in neighbor_dict[user]:
-        s2 = set(neighbor_dict[venue_i])
-        intersect = s1.intersection(s2)
+        intersect = _intersection(neighbor_dict, s1, venue_i)
         if len(intersect) > len(max_intersect):
             max_intersect = intersect
-    weighted_score = 0
-    for z in max_intersect:
-        degree = graph.GetNI(z).GetDeg()
-        if degree > 1:
-            weighted_score += 1.0 / log(degree)
-    return weighted_score
+    return _adamic_adar_sum(graph, neighbor_dict, max_intersect)
 
 
 def preferential_attachment(graph, x, y, neighbor_dict):
     """
     Degree(x) * Degree(y)
     """
+    if isinstance(neighbor_dict, CSRAdjacency):
+        return neighbor_dict.degree(x) * neighbor_dict.degree(y)
     degree_x = graph.GetNI(x).GetDeg()
     degree_y = graph.GetNI(y).GetDeg()
     return degree_x * degree_y
 
 
-def katz(graph, x, y, neighbor_dict):
+def katz(graph, x, y, neighbor_dict, beta=0.005, max_length=3):
     """
-    Katz (Exponentially Damped Path Counts)
+    Katz (Exponentially Damped Path Counts) over paths of length 1 to
+    max_length.
     """
+    if isinstance(neighbor_dict, CSRAdjacency):
+        return _katz_csr(neighbor_dict, x, y, beta, max_length)
     neighbor_cache = {}
-    beta = 0.005
     path_lengths = {}
     path_length = 1
     nodes_to_explore = [x]
-    while path_length < 4:
+    while path_length <= max_length:
         new_nodes_to_explore = []
         for node in nodes_to_explore:
             neighbors = neighbor_dict[node]
@@ -134,3 +157,146 @@ def katz(graph, x, y, neighbor_dict):
     for l in path_lengths:
         score += beta**l * path_lengths[l]
     return score
+
+
+def friend_checkins(graph, user, venue, neighbor_dict):
+    """
+    Number of friends of user who checked in at venue
+    """
+    friends = neighbor_dict.friends_of(user)
+    return float(len(np.intersect1d(friends, neighbor_dict[venue], assume_unique=True)))
+
+
+def friend_ratings(graph, user, venue, neighbor_dict):
+    """
+    Sum of the ratings of venue by friends of user
+    """
+    raters, ratings = neighbor_dict.raters_of(venue)
+    return float(ratings[id_sets.contains(neighbor_dict.friends_of(user), raters)].sum())
+
+
+def weighted_common_neighbors_user(graph, user, venue, neighbor_dict):
+    """
+    Weighted common neighbors (Lu & Zhou): sum over common neighbors z of
+    (w(x, z) + w(y, z)) / 2, adapted as num_common_neighbors_user() to the
+    max over all user_i in N(venue). Equals num_common_neighbors_user()
+    when every edge weighs 1.
+    """
+    return _weighted_overlaps(neighbor_dict, user, venue)[0]
+
+
+def weighted_adamic_adar_user(graph, user, venue, neighbor_dict):
+    """
+    Weighted Adamic/Adar (Lu & Zhou): sum over common neighbors z of
+    (w(x, z) + w(y, z)) / 2 / log(s(z)), where s(z) is the total weight of
+    the edges of z, over the user_i with the largest weighted common
+    neighbors score
+    """
+    return _weighted_overlaps(neighbor_dict, user, venue)[1]
+
+
+def weighted_katz(graph, x, y, neighbor_dict, beta=0.005, max_length=3):
+    """
+    Katz over weighted paths: sum of beta^l * (W^l)[x, y], where a path
+    weighs the product of its edge weights
+    """
+    target = neighbor_dict.index(y)
+    nodes, walks = np.array([neighbor_dict.index(x)]), np.ones(1)
+    score = 0
+    for path_length in range(1, max_length + 1):
+        nodes, walks = neighbor_dict.expand_weighted(nodes, walks)
+        score += beta**path_length * walks[nodes == target].sum()
+    return score
+
+
+def geo_distance(graph, user, venue, neighbor_dict):
+    """
+    Negative great-circle distance in km between venue and the centroid of
+    the venues user checked in at
+    """
+    locations = neighbor_dict.locations
+    centroid = locations.centroid(neighbor_dict[user])
+    return -float(geo_index.distances_km(centroid[None, :], locations.points([venue]))[0, 0])
+
+
+#*******************************************************************************
+# Helper functions
+#*******************************************************************************
+
+_connectivity_cache = {}
+
+def _is_connected(graph):
+    """
+    snap.IsConnected(graph), computed once per graph. The cached result is
+    reused as long as the node and edge counts are unchanged.
+    """
+    key = (id(graph), graph.GetNodes(), graph.GetEdges())
+    if key not in _connectivity_cache:
+        _connectivity_cache.clear()
+        _connectivity_cache[key] = snap.IsConnected(graph)
+    return _connectivity_cache[key]
+
+
+def _neighbor_set(neighbor_dict, x):
+    """
+    Neighbors of x in the form expected by _intersection(): a set for a
+    neighbor dict, a sorted array of dense indices for a CSRAdjacency.
+    """
+    if isinstance(neighbor_dict, CSRAdjacency):
+        return neighbor_dict.neighbor_indices(neighbor_dict.index(x))
+    return set(neighbor_dict[x])
+
+
+def _intersection(neighbor_dict, s1, y):
+    if isinstance(neighbor_dict, CSRAdjacency):
+        return neighbor_dict.intersect(s1, neighbor_dict.neighbor_indices(neighbor_dict.index(y)))
+    return s1.intersection(neighbor_dict[y])
+
+
+def _adamic_adar_sum(graph, neighbor_dict, nodes):
+    """
+    Sum of 1 / log(degree) over nodes with degree > 1, where nodes come
+    from _intersection().
+    """
+    if isinstance(neighbor_dict, CSRAdjacency):
+        degrees = neighbor_dict.degrees[np.asarray(nodes, dtype=np.int64)]
+        degrees = degrees[degrees > 1]
+        return float(np.sum(1.0 / np.log(degrees)))
+    weighted_score = 0
+    for z in nodes:
+        degree = graph.GetNI(z).GetDeg()
+        if degree > 1:
+            weighted_score += 1.0 / log(degree)
+    return weighted_score
+
+
+def _weighted_overlaps(adjacency, user, venue):
+    """
+    (weighted common neighbors, weighted Adamic/Adar) of user with the
+    first user_i in N(venue) that has the largest weighted common
+    neighbors score.
+    """
+    x = adjacency.index(user)
+    neighbors_x, weights_x = adjacency.neighbor_indices(x), adjacency.neighbor_weights(x)
+    strengths = adjacency.strengths
+    best, best_adamic_adar = 0.0, 0.0
+    for i in adjacency.neighbor_indices(adjacency.index(venue)):
+        common, in_x, in_i = np.intersect1d(neighbors_x, adjacency.neighbor_indices(i),
+                                            assume_unique=True, return_indices=True)
+        pair_weights = (weights_x[in_x] + adjacency.neighbor_weights(i)[in_i]) / 2
+        score = pair_weights.sum()
+        if score > best:
+            s = strengths[common]
+            best = score
+            best_adamic_adar = float(np.sum(pair_weights[s > 1] / np.log(s[s > 1])))
+    return float(best), best_adamic_adar
+
+
+def _katz_csr(adjacency, x, y, beta, max_length):
+    target = adjacency.index(y)
+    nodes_to_explore = np.array([adjacency.index(x)])
+    score = 0
+    for path_length in range(1, max_length + 1):
+        nodes_to_explore = adjacency.expand(nodes_to_explore)
+        score += beta**path_length * np.count_nonzero(nodes_to_explore == target)
+    return score
@@ -0,0 +1,108 @@
+"""
+holdout.py
+----------
+Seeded selection of held-out test edges over the edge array.
+
+As in the original main.remove_edges(), an edge can only be removed if
+both its endpoints keep at least one edge, i.e. at most degree - 1 edges
+are removed around any node. Edges are visited in a random order and
+accepted in vectorized rounds: in each round, an edge is accepted when it
+is among the first remaining-budget candidates of both its endpoints.
+
+Edges can also be split into k disjoint folds, each selected under the
+same constraint, and a split can be saved to disk and reused.
+"""
+
+import numpy as np
+
+TRAIN = -1
+
+
+def assign_folds(src, dst, num_folds=1, fraction=0.2, seed=None):
+    """
+    Return an array giving the test fold (0..num_folds-1) of every edge,
+    or TRAIN for edges that are never held out. Each fold holds up to
+    fraction of all edges.
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    node_ids, dense = np.unique(np.concatenate((src, dst)), return_inverse=True)
+    src_idx, dst_idx = dense[:len(src)], dense[len(src):]
+    rng = np.random.RandomState(seed)
+    folds = np.full(len(src), TRAIN, dtype=np.int32)
+    for fold in range(num_folds):
+        available = np.flatnonzero(folds == TRAIN)
+        test = _sample(src_idx, dst_idx, available, int(len(src) * fraction), rng)
+        folds[test] = fold
+    return folds
+
+
+def _sample(src_idx, dst_idx, available, num_edges, rng):
+    """
+    Pick up to num_edges edges from available such that every node keeps
+    at least one edge.
+    """
+    degrees = np.bincount(np.concatenate((src_idx, dst_idx)))
+    budget = degrees - 1
+    candidates = available[rng.permutation(len(available))]
+    selected = []
+    num_selected = 0
+    while num_selected < num_edges:
+        candidates = candidates[(budget[src_idx[candidates]] > 0) & (budget[dst_idx[candidates]] > 0)]
+        if len(candidates) == 0:
+            break
+        src_c, dst_c = src_idx[candidates], dst_idx[candidates]
+        ok = (_rank_within(src_c) < budget[src_c]) & (_rank_within(dst_c) < budget[dst_c])
+        accepted = candidates[ok][:num_edges - num_selected]
+        budget -= np.bincount(np.concatenate((src_idx[accepted], dst_idx[accepted])),
+                              minlength=len(budget))
+        selected.append(accepted)
+        num_selected += len(accepted)
+        candidates = candidates[~ok]
+    if not selected:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(selected)
+
+
+def _rank_within(keys):
+    """
+    For each position, how many earlier positions have the same key.
+    """
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    group_start = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    group_sizes = np.diff(np.r_[group_start, len(keys)])
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = np.arange(len(keys)) - np.repeat(group_start, group_sizes)
+    return ranks
+
+
+def save_split(filename, src, dst, folds, seed=None, num_folds=None):
+    if num_folds is None:
+        num_folds = int(folds.max()) + 1 if len(folds) else 1
+    with open(filename, 'wb') as file:
+        np.savez(file, src=src, dst=dst, folds=folds,
+                 seed=-1 if seed is None else seed, num_folds=num_folds)
+
+
+def load_split(filename):
+    """
+    Return (src, dst, folds) saved by save_split().
+    """
+    data = np.load(filename)
+    return data['src'], data['dst'], data['folds']
+
+
+def split_params(filename):
+    """
+    Return (num_folds, seed) of the split saved by save_split(), seed being
+    None if the split was not seeded. Splits saved without num_folds have
+    as many folds as their largest fold number + 1.
+    """
+    data = np.load(filename)
+    seed = int(data['seed'])
+    if 'num_folds' in data.files:
+        num_folds = int(data['num_folds'])
+    else:
+        num_folds = int(data['folds'].max()) + 1 if len(data['folds']) else 1
+    return num_folds, None if seed == -1 else seed
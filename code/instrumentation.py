@@ -0,0 +1,112 @@
+"""
+instrumentation.py
+------------------
+Lightweight per-stage timers and counters for the link prediction pipeline.
+
+    instr = Instrumentation(profile_dir='profiles', trace_memory=True)
+    with instr.stage('load_graph'):
+        graph = load_graph(...)
+    instrumentation.count('pairs_scored', n)
+    instr.summary()
+    instr.dump('stats.json')
+
+Each stage records its wall-clock time and, optionally, its peak traced
+memory (tracemalloc) and a cProfile dump in profile_dir. count() adds to
+a counter of the active Instrumentation from anywhere in the code and is
+a no-op when none is active, so hot paths can be instrumented for free.
+Worker processes hand their counters back with take_counts(), and the
+parent adds them with add_counts().
+"""
+
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# time.clock() was removed in Python 3.8
+clock = getattr(time, 'perf_counter', time.time)
+
+_active = None
+
+
+def count(name, value=1):
+    """
+    Add value to counter name of the active Instrumentation, if any.
+    """
+    if _active is not None:
+        _active.counters[name] = _active.counters.get(name, 0) + value
+
+
+def take_counts():
+    """
+    Return the counters of the active Instrumentation and reset them.
+    """
+    if _active is None:
+        return {}
+    counters, _active.counters = _active.counters, {}
+    return counters
+
+
+def add_counts(counters):
+    for name, value in counters.items():
+        count(name, value)
+
+
+class Instrumentation(object):
+
+    def __init__(self, profile_dir=None, trace_memory=False):
+        global _active
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory and tracemalloc is not None
+        self.stages = []
+        self.counters = {}
+        _active = self
+
+    @contextmanager
+    def stage(self, name):
+        record = {'name': name}
+        profiler = None
+        if self.profile_dir:
+            profiler = cProfile.Profile()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = clock()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record['seconds'] = clock() - start
+            if self.trace_memory:
+                record['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            if profiler:
+                if not os.path.isdir(self.profile_dir):
+                    os.makedirs(self.profile_dir)
+                record['profile'] = os.path.join(self.profile_dir, name + '.prof')
+                profiler.dump_stats(record['profile'])
+            self.stages.append(record)
+
+    def summary(self):
+        total = sum(record['seconds'] for record in self.stages)
+        print('{0:25s} {1:>10s} {2:>8s} {3:>12s}'.format('Stage', 'Time (s)', '% total', 'Peak (MB)'))
+        for record in self.stages:
+            peak = record.get('peak_memory_bytes')
+            print('{0:25s} {1:10.2f} {2:8.1f} {3:>12s}'.format(
+                record['name'], record['seconds'], record['seconds'] * 100.0 / total if total else 0,
+                '{0:.1f}'.format(peak / 1e6) if peak is not None else '-'))
+        print('{0:25s} {1:10.2f}'.format('Total', total))
+        for name in sorted(self.counters):
+            print('{}: {}'.format(name, self.counters[name]))
+
+    def dump(self, filename):
+        with open(filename, 'w') as file:
+            json.dump({'stages': self.stages, 'counters': self.counters}, file, indent=2)
@@ -0,0 +1,232 @@
+"""
+loader.py
+---------
+Bulk loaders that parse checkin files straight into NumPy int arrays.
+
+Files are read in large byte chunks cut at line boundaries and each chunk
+is tokenized by np.loadtxt's C parser, so no Python object is created per
+line. The resulting edge arrays can be turned into a CSRAdjacency or a
+BipartiteMatrix directly, or into a SNAP graph when one is needed.
+
+Run this script to benchmark it against the line-by-line parsing in
+processCheckIns.read_input() and snap.LoadEdgeList.
+"""
+
+import io
+import time
+import warnings
+import numpy as np
+
+MAX_USER_ID = 2153502   # pre-computed, see processCheckIns.py
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def read_checkins_dat(filename, max_user_id=MAX_USER_ID, chunk_bytes=CHUNK_BYTES):
+    """
+    Parse the pipe-delimited UMN checkins.dat into (user ids, venue ids)
+    arrays. As in processCheckIns.read_input(), max_user_id is added to
+    venue ids so that they don't overlap with user ids.
+    """
+    users, venues = [], []
+    for i, chunk in enumerate(_read_chunks(filename, chunk_bytes)):
+        # The first two lines are the column names and the '---+---' rule,
+        # and the '(N rows)' footer is dropped as a comment.
+        pairs = _loadtxt(chunk, delimiter='|', usecols=(1, 2), comments='(',
+                         skiprows=2 if i == 0 else 0)
+        users.append(pairs[:, 0])
+        venues.append(pairs[:, 1] + max_user_id)
+    return _concatenate(users), _concatenate(venues)
+
+
+def read_edge_list(filename, chunk_bytes=CHUNK_BYTES):
+    """
+    Parse a whitespace separated edge list (e.g. sampled_checkins.txt) into
+    (src, dst) arrays. Lines starting with '#' are ignored.
+    """
+    src, dst = [], []
+    for chunk in _read_chunks(filename, chunk_bytes):
+        pairs = _loadtxt(chunk, usecols=(0, 1), comments='#')
+        src.append(pairs[:, 0])
+        dst.append(pairs[:, 1])
+    return _concatenate(src), _concatenate(dst)
+
+
+def read_social_graph(filename, user_offset=MAX_USER_ID, chunk_bytes=CHUNK_BYTES):
+    """
+    Parse socialgraph.tsv written by other/processDataset.py into (user
+    ids, friend user ids) arrays. processDataset.py adds the max user id to
+    user ids, whereas the checkins graph adds it to venue ids, so
+    user_offset is subtracted to get back the ids used here.
+    """
+    users, friends = [], []
+    for i, chunk in enumerate(_read_chunks(filename, chunk_bytes)):
+        pairs = _loadtxt(chunk, delimiter='\t', usecols=(0, 1), skiprows=1 if i == 0 else 0)
+        users.append(pairs[:, 0] - user_offset)
+        friends.append(pairs[:, 1] - user_offset)
+    return _concatenate(users), _concatenate(friends)
+
+
+def read_ratings(filename, user_offset=MAX_USER_ID, max_user_id=MAX_USER_ID,
+                 chunk_bytes=CHUNK_BYTES):
+    """
+    Parse ratings.tsv written by other/processDataset.py into (user ids,
+    venue ids, ratings) arrays, in the id space of the checkins graph (see
+    read_social_graph() and read_checkins_dat()).
+    """
+    users, venues, ratings = [], [], []
+    for i, chunk in enumerate(_read_chunks(filename, chunk_bytes)):
+        rows = _loadtxt(chunk, delimiter='\t', usecols=(0, 1, 2), skiprows=1 if i == 0 else 0)
+        users.append(rows[:, 0] - user_offset)
+        venues.append(rows[:, 1] + max_user_id)
+        ratings.append(rows[:, 2])
+    return _concatenate(users), _concatenate(venues), _concatenate(ratings)
+
+
+def read_venue_locations(filename, max_user_id=MAX_USER_ID, chunk_bytes=CHUNK_BYTES):
+    """
+    Parse venues.tsv written by other/processDataset.py into (venue ids,
+    latitudes, longitudes) arrays, with max_user_id added to the venue ids
+    as in the checkins graph. Venues without coordinates are skipped.
+    """
+    venues, latitudes, longitudes = [], [], []
+    for i, chunk in enumerate(_read_chunks(filename, chunk_bytes)):
+        with warnings.catch_warnings():
+            # Rows with missing coordinates have fewer columns
+            warnings.simplefilter('ignore')
+            rows = np.genfromtxt(io.StringIO(chunk), delimiter='\t', usecols=(0, 1, 2),
+                                 skip_header=1 if i == 0 else 0, invalid_raise=False, ndmin=2)
+        rows = rows[np.isfinite(rows).all(axis=1)]
+        venues.append(rows[:, 0].astype(np.int64) + max_user_id)
+        latitudes.append(rows[:, 1])
+        longitudes.append(rows[:, 2])
+    return _concatenate(venues), _concatenate(latitudes), _concatenate(longitudes)
+
+
+def aggregate_edges(src, dst):
+    """
+    Collapse repeated undirected edges, e.g. repeat checkins of a user at
+    a venue, into distinct edges with integer weights, with one sort of
+    packed 64-bit edge keys. Returns (smaller ids, larger ids, counts),
+    sorted by edge.
+    """
+    keys, counts = np.unique(_edge_keys(src, dst), return_counts=True)
+    return keys >> 32, keys & 0xffffffff, counts
+
+
+def lookup_weights(src, dst, weighted_src, weighted_dst, weights, default=1):
+    """
+    Weight of every edge (src[i], dst[i]) among the edges returned by
+    aggregate_edges() with their weights, or default for missing edges.
+    """
+    keys = _edge_keys(weighted_src, weighted_dst)
+    queries = _edge_keys(src, dst)
+    out = np.full(len(queries), default, dtype=np.float64)
+    if len(keys) == 0:
+        return out
+    pos = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+    found = keys[pos] == queries
+    out[found] = np.asarray(weights, dtype=np.float64)[pos[found]]
+    return out
+
+
+def build_graph(src, dst):
+    """
+    SNAP undirected graph with edges (src[i], dst[i]).
+    """
+    import snap
+    graph = snap.TUNGraph.New()
+    for node_id in np.unique(np.concatenate((src, dst))).tolist():
+        graph.AddNode(node_id)
+    for u, v in zip(src.tolist(), dst.tolist()):
+        graph.AddEdge(u, v)
+    return graph
+
+
+#*******************************************************************************
+# Helper functions
+#*******************************************************************************
+
+def _read_chunks(filename, chunk_bytes):
+    """
+    Yield the file's contents as text chunks of about chunk_bytes, each
+    ending at a line boundary.
+    """
+    with open(filename, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_bytes)
+            if not chunk:
+                break
+            chunk += file.readline()
+            yield chunk.decode('utf-8', 'replace')
+
+
+def _loadtxt(text, **kwargs):
+    with warnings.catch_warnings():
+        # A chunk may hold only a header or footer
+        warnings.simplefilter('ignore', UserWarning)
+        return np.loadtxt(io.StringIO(text), dtype=np.int64, ndmin=2, **kwargs)
+
+
+def _edge_keys(src, dst):
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    return (np.minimum(src, dst) << 32) | np.maximum(src, dst)
+
+
+def _concatenate(arrays):
+    if not arrays:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(arrays)
+
+
+def _read_checkins_lines(filename, max_user_id):
+    """
+    Line-by-line parsing as done by processCheckIns.read_input(), kept as
+    the benchmark baseline.
+    """
+    user_venue_edges = []
+    with open(filename, 'r') as input:
+        for i, line in enumerate(input):
+            parsed = [str.strip() for str in line.split('|')]
+            if i <= 1 or len(parsed) < 6:
+                continue
+            user_venue_edges.append((int(parsed[1]), int(parsed[2]) + max_user_id))
+    return user_venue_edges
+
+
+def benchmark(checkins_dat, edge_list):
+    """
+    Time the array loaders against the current loading path.
+    """
+    start = time.time()
+    edges = _read_checkins_lines(checkins_dat, MAX_USER_ID)
+    line_time = time.time() - start
+    start = time.time()
+    users, venues = read_checkins_dat(checkins_dat)
+    array_time = time.time() - start
+    assert len(edges) == len(users)
+    print('checkins.dat: {} rows'.format(len(users)))
+    print('  line by line: {0:.2f}s, arrays: {1:.2f}s'.format(line_time, array_time))
+
+    import snap
+    start = time.time()
+    graph = snap.LoadEdgeList(snap.PUNGraph, edge_list, 0, 1)
+    snap_time = time.time() - start
+    start = time.time()
+    src, dst = read_edge_list(edge_list)
+    array_time = time.time() - start
+    start = time.time()
+    build_graph(src, dst)
+    build_time = time.time() - start
+    print('{}: {} edges'.format(edge_list, graph.GetEdges()))
+    print('  snap.LoadEdgeList: {0:.2f}s, arrays: {1:.2f}s, arrays + build_graph: {2:.2f}s'.format(
+        snap_time, array_time, array_time + build_time))
+
+
+def main():
+    benchmark('../data/umn_foursquare_datasets/checkins.dat',
+              '../data/processed/sampled_checkins.txt')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+lsh_index.py
+------------
+Banded MinHash index over venue neighborhoods for candidate retrieval.
+
+Each venue gets a MinHash signature of the set of users who checked in
+there (see minhash.py), cut into num_bands bands of rows_per_band hashes.
+Venues whose signatures agree on a whole band share a bucket, which
+happens with probability 1 - (1 - J^rows_per_band)^num_bands for two
+venues of Jaccard similarity J, an S-curve rising around
+J = (1 / num_bands)^(1 / rows_per_band). Venue neighborhoods are small,
+so typical Jaccard similarities are around 0.1, and bands of 1 or 2 rows
+keep the threshold low enough to retrieve them. The candidate venues of
+a user are the venues sharing a bucket with a venue they visited, found
+with a binary search in each band's sorted bucket keys instead of a pass
+over all venues. The candidates are then scored exactly.
+
+The index is built once per training graph and saved to disk, see
+load_or_build(). LSHIndex.block() has the same interface as
+candidates.CandidatePairs.block(), so it can be passed to main.train()
+as its candidates.
+"""
+
+import os
+import numpy as np
+import scipy.sparse as sp
+import minhash
+import score_cache
+
+# Multiplier combining the hashes of a band into one 64-bit bucket key
+BAND_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class LSHIndex(object):
+
+    def __init__(self, matrix, band_keys, fingerprint, num_bands, rows_per_band, seed):
+        """
+        matrix is a sparse_scoring.BipartiteMatrix and band_keys the
+        (num_venues x num_bands) bucket keys of its venues.
+        """
+        self.matrix = matrix
+        self.band_keys = band_keys
+        self.fingerprint = fingerprint
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        self.seed = seed
+        # Venues without checkins have no signature and are never retrieved
+        self.indexed = np.flatnonzero(np.diff(matrix.csc.indptr) > 0)
+        order = np.argsort(band_keys[self.indexed], axis=0, kind='mergesort')
+        self.venue_order = self.indexed[order]
+        self.sorted_keys = np.take_along_axis(band_keys[self.indexed], order, axis=0)
+
+    @classmethod
+    def build(cls, matrix, num_bands=32, rows_per_band=2, seed=0):
+        a, b = minhash.hash_functions(num_bands * rows_per_band, seed)
+        signatures = minhash.min_hashes(matrix.csc.indptr, matrix.csc.indices, a, b)
+        return cls(matrix, band_keys(signatures, num_bands), score_cache.graph_fingerprint(matrix),
+                   num_bands, rows_per_band, seed)
+
+    def save(self, filename):
+        with open(filename, 'wb') as file:
+            np.savez(file, band_keys=self.band_keys, fingerprint=np.array(self.fingerprint),
+                     params=np.array([self.num_bands, self.rows_per_band, self.seed]))
+
+    @classmethod
+    def load(cls, filename, matrix):
+        data = np.load(filename)
+        num_bands, rows_per_band, seed = data['params'].tolist()
+        return cls(matrix, data['band_keys'], str(data['fingerprint']), num_bands, rows_per_band,
+                   seed)
+
+    def matches(self, matrix, num_bands, rows_per_band, seed):
+        """
+        Whether this index was built from matrix with the same parameters.
+        """
+        return (self.fingerprint == score_cache.graph_fingerprint(matrix)
+                and (self.num_bands, self.rows_per_band, self.seed) == (num_bands, rows_per_band, seed))
+
+    def block(self, rows):
+        """
+        Boolean (len(rows) x num_venues) CSR matrix of the venues visited
+        by the given user rows and the venues sharing a bucket with them.
+        """
+        visits = self.matrix.csr[rows]
+        visit_rows = np.repeat(np.arange(len(rows)), np.diff(visits.indptr))
+        keys = self.band_keys[visits.indices]
+        result_rows, result_cols = [visit_rows], [visits.indices]
+        for band in range(self.num_bands):
+            lo = np.searchsorted(self.sorted_keys[:, band], keys[:, band], side='left')
+            hi = np.searchsorted(self.sorted_keys[:, band], keys[:, band], side='right')
+            lengths = hi - lo
+            positions = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            result_rows.append(np.repeat(visit_rows, lengths))
+            result_cols.append(self.venue_order[positions, band])
+        result_rows, result_cols = np.concatenate(result_rows), np.concatenate(result_cols)
+        reach = sp.csr_matrix((np.ones(len(result_rows), dtype=bool), (result_rows, result_cols)),
+                              shape=(len(rows), self.matrix.num_venues))
+        reach.sum_duplicates()
+        reach.sort_indices()
+        return reach
+
+
+def band_keys(signatures, num_bands):
+    """
+    (num rows x num_bands) uint64 bucket keys of the bands of signatures.
+    """
+    rows_per_band = signatures.shape[1] // num_bands
+    bands = signatures[:, :num_bands * rows_per_band].astype(np.uint64)
+    bands = bands.reshape(len(signatures), num_bands, rows_per_band)
+    keys = np.zeros((len(signatures), num_bands), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for r in range(rows_per_band):
+            keys = keys * BAND_MULTIPLIER + bands[:, :, r]
+    return keys
+
+
+def load_or_build(filename, matrix, num_bands=32, rows_per_band=2, seed=0):
+    """
+    Load the index saved at filename if it was built from the same graph
+    and parameters, otherwise build it and save it there.
+    """
+    if os.path.exists(filename):
+        index = LSHIndex.load(filename, matrix)
+        if index.matches(matrix, num_bands, rows_per_band, seed):
+            print('Loaded LSH index from {}'.format(filename))
+            return index
+    print('Building LSH index...')
+    index = LSHIndex.build(matrix, num_bands, rows_per_band, seed)
+    index.save(filename)
+    return index
@@ -1,39 +1,191 @@
-import snap
+import argparse
 import heuristics
-import time
-import random
+import adjacency
+import candidates
+import cooccurrence
+import dataset_cache
+import evaluation
+import geo_index
+import hetero_graph
+import holdout
+import id_sets
+import instrumentation
+import loader
+import lsh_index
+import minhash
+import parallel
+import score_cache
+import sparse_scoring
+import topk
+import os
+import numpy as np
 
-def train(graph, users, venues, score_fn, neighbor_dict):
-    print('Calculating scores for the training set...')
-    start = time.clock()
-    scores = []
+def train(graph, users, venues, score_fn, neighbor_dict, matrix=None, top_k=0.2, workers=1,
+          score_params=None, candidates=None, cache=None):
+    """
+    Score every (user, venue) pair and return the top_k best as a list of
+    ((u, v), score) sorted by decreasing score. top_k is either a fraction
+    of all pairs or an absolute count; only that many pairs are kept in
+    memory while scoring.
+
+    If a sparse_scoring.BipartiteMatrix is given and score_fn has a block
+    version, whole blocks of users are scored at once; otherwise score_fn
+    is called once per pair. With workers > 1, shards of users are scored
+    in parallel processes. score_params are extra keyword arguments for
+    score_fn, e.g. the Katz beta. If candidates (a candidates.CandidatePairs)
+    is given, only the candidate pairs are scored. Score blocks are read
+    from and stored in cache (a score_cache.ScoreCache) if given.
+    """
+    users, venues = sorted(users), sorted(venues)
+    num_pairs = len(users) * len(venues)
+    k = topk.resolve_k(top_k, num_pairs)
+    if matrix is not None and not sparse_scoring.has_block_fn(score_fn):
+        matrix = None
+    print('Calculating scores for the training set{}...'.format(
+        ' (sparse)' if matrix is not None else ''))
+    start = instrumentation.clock()
+    args = (graph, users, venues, score_fn, score_params or {}, neighbor_dict, matrix, k, candidates,
+            cache)
+    if workers > 1:
+        selector = parallel.score_in_shards(score_shard, args, len(users), k, workers,
+                                            block_size=sparse_scoring.BLOCK_SIZE)
+    else:
+        selector = score_shard(*(args + (0, len(users), start)))
+    print('Calculations complete! Time taken: {0:.2f}s'.format(instrumentation.clock() - start))
+    instrumentation.count('pairs_scored', selector.num_pushed)
+    if candidates is not None:
+        print_pruned(selector.num_pushed, num_pairs, candidates.matrix.csr.nnz)
+    scores = selector.result()
+    print_top_scores(scores)
+    return scores
+
+def score_shard(graph, users, venues, score_fn, score_params, neighbor_dict, matrix, k, candidates,
+                cache, lo, hi, start=None):
+    """
+    Score users[lo:hi] against all venues, or against their candidate
+    venues, and return a TopKSelector holding the shard's best k pairs.
+    Pairs are numbered by their position among all pairs, so shards merge
+    deterministically. Progress is printed if start time is given.
+    """
+    selector = topk.TopKSelector(k, start=lo * len(venues))
     num_iterations = 0
-    for u in users:
-        for v in venues:
-            score = score_fn(graph, u, v, neighbor_dict)
-            scores.append(((u, v), score))
+    if matrix is not None:
+        for block_users, block in sparse_scoring.score_blocks(
+                matrix, score_fn, lo=lo, hi=hi, score_params=score_params, cache=cache):
+            num_iterations += push_block(selector, matrix, block_users, block,
+                                         candidate_block(matrix, block_users, candidates))
+            if start is not None:
+                print('Time taken: {0:.2f}s, # iterations: {1}'.format(instrumentation.clock() - start, num_iterations))
+        return selector
+    for row in range(lo, hi):
+        u = users[row]
+        if candidates is None:
+            cols = range(len(venues))
+        else:
+            cols = candidates.block(np.array([row])).indices.tolist()
+        scores = []
+        for col in cols:
+            scores.append(score_fn(graph, u, venues[col], neighbor_dict, **score_params))
             num_iterations += 1
-            if (num_iterations % 1000 == 0):
-                print('Time taken: {0:.2f}s, # iterations: {1}'.format(time.clock() - start, num_iterations))
-    print('Calculations complete! Time taken: {0:.2f}s'.format(time.clock() - start))
+            if (start is not None and num_iterations % 1000 == 0):
+                print('Time taken: {0:.2f}s, # iterations: {1}'.format(instrumentation.clock() - start, num_iterations))
+        cols = np.array(cols, dtype=np.int64)
+        selector.push(np.full(len(cols), u), np.array(venues)[cols], scores, row * len(venues) + cols)
+    return selector
+
+def train_all(users, venues, score_fns, matrix, top_k=0.2, workers=1, score_params=None,
+              candidates=None, cache=None):
+    """
+    Score every (user, venue) pair with all of score_fns in a single pass
+    over the user blocks of matrix, sharing the sparse products between
+    the heuristics (see sparse_scoring.all_heuristics_block). Returns a
+    dict of top-K lists, as returned by train(), keyed by heuristic name.
+    score_params maps heuristic names to their keyword arguments.
+    candidates and cache are used as in train().
+    """
+    users, venues = sorted(users), sorted(venues)
+    num_pairs = len(users) * len(venues)
+    k = topk.resolve_k(top_k, num_pairs)
+    names = [score_fn.__name__ for score_fn in score_fns]
+    print('Calculating scores of {} heuristics for the training set...'.format(len(names)))
+    start = instrumentation.clock()
+    args = (venues, names, score_params or {}, matrix, k, candidates, cache)
+    if workers > 1:
+        selectors = parallel.score_in_shards(score_all_shard, args, len(users), k, workers,
+                                             selector=topk.TopKSelectors(names, k),
+                                             block_size=sparse_scoring.BLOCK_SIZE)
+    else:
+        selectors = score_all_shard(*(args + (0, len(users), start)))
+    print('Calculations complete! Time taken: {0:.2f}s'.format(instrumentation.clock() - start))
+    instrumentation.count('pairs_scored', selectors.num_pushed)
+    if candidates is not None:
+        print_pruned(selectors.num_pushed, num_pairs, candidates.matrix.csr.nnz)
+    return selectors.result()
+
+def score_all_shard(venues, names, score_params, matrix, k, candidates, cache, lo, hi, start=None):
+    """
+    score_shard() for several heuristics at once; returns a
+    topk.TopKSelectors keyed by heuristic name.
+    """
+    selectors = topk.TopKSelectors(names, k, start=lo * len(venues))
+    num_iterations = 0
+    for block_users, blocks in sparse_scoring.score_all_blocks(
+            matrix, names, lo=lo, hi=hi, score_params=score_params, cache=cache):
+        reach = candidate_block(matrix, block_users, candidates)
+        for name in names:
+            num_iterations += push_block(selectors[name], matrix, block_users, blocks[name], reach)
+        if start is not None:
+            print('Time taken: {0:.2f}s, # iterations: {1}'.format(instrumentation.clock() - start, num_iterations))
+    return selectors
+
+def candidate_block(matrix, block_users, candidates=None):
+    """
+    Boolean CSR matrix of the candidate venues of block_users, or None to
+    score all venues.
+    """
+    if candidates is None:
+        return None
+    return candidates.block(np.searchsorted(matrix.users, block_users))
+
+def push_block(selector, matrix, block_users, block, reach=None):
+    """
+    Push a score block of matrix.venues, or only its pairs in reach (see
+    candidate_block()), and return the number of pairs pushed.
+    """
+    if reach is None:
+        selector.push_block(block_users, matrix.venues, block)
+        return block.size
+    rows = np.searchsorted(matrix.users, block_users)
+    block_rows, cols = reach.nonzero()
+    selector.push(block_users[block_rows], matrix.venues[cols], block[block_rows, cols],
+                  rows[block_rows] * matrix.num_venues + cols)
+    return len(cols)
+
+def print_pruned(num_scored, num_pairs, num_visited):
+    """
+    Candidate sources always include the venues visited in training, so
+    num_scored - num_visited of the scored pairs were actually retrieved.
+    """
+    num_pruned = num_pairs - num_scored
+    print('Scored {} candidate pairs ({} not visited in training), pruned {} of {} pairs ({:.2f}%)'.format(
+        num_scored, num_scored - num_visited, num_pruned, num_pairs,
+        num_pruned * 100.0 / max(num_pairs, 1)))
+
+def print_top_scores(scores):
     print('Top 10 most similar nodes')
-    scores.sort(key=lambda x: x[1], reverse=True)
     for item in scores[:10]:
         print(item)
-    return scores
 
-def validate(edges, scores):
-    TP = 0
-    FP = 0
-    cutoff = int(len(scores) * 0.2)
-    # Take top 20% of the scores
-    for node_pair, score in scores[:cutoff]:
-        u, v = node_pair
-        if (u, v) in edges or (v, u) in edges:
-            TP += 1
-        else:
-            FP += 1
-    FN = len(edges) - TP
+def validate(edges, scores, num_pairs=None):
+    """
+    Evaluate the predicted pairs (the top-K list returned by train())
+    against the removed test edges. num_pairs is the number of candidate
+    pairs, used for AUC.
+    """
+    ranked_pairs = [node_pair for node_pair, score in scores]
+    results = evaluation.evaluate(list(edges), ranked_pairs, [score for node_pair, score in scores],
+                                  num_pairs)
+    TP, FP, FN = results['TP'], results['FP'], results['FN']
     print('# TP: {}'.format(TP))
     print('# FP: {}'.format(FP))
     print('# FN: {}'.format(FN))
@@ -41,32 +193,172 @@ def validate(edges, scores):
     print('Accuracy: {0:.2f}%'.format(TP * 100.0 / len(edges)))
     print('Precision: {0:.2f}%'.format(TP * 100.0 / (TP + FP)))
     print('Recall: {0:.2f}%'.format(TP * 100.0 / (TP + FN)))
+    print('Average precision: {0:.4f}'.format(results['average_precision']))
+    print('AUC: {0:.4f}'.format(results['auc']))
+    print('K, Precision@K, Recall@K')
+    for k, precision, recall in zip(results['cutoffs'], results['precision_at'], results['recall_at']):
+        print('{0}, {1:.2f}%, {2:.2f}%'.format(k, precision * 100, recall * 100))
+    return results
 
-def remove_edges(training_graph):
-    # Train: 80%, Test: 20%
-    num_edges_to_remove = int(training_graph.GetEdges() * 0.2)
-    nodes = [node.GetId() for node in training_graph.Nodes()]
-    removed_edges = set()
-    while num_edges_to_remove > 0:
-        # Pick a random node
-        node = random.choice(nodes)
-        NI = training_graph.GetNI(node)
-        if NI.GetDeg() < 2:
-            continue
-
-        # Pick a random neighbor with degree > 1
-        neighbors = get_neighbors(NI)
-        random_neighbor = random.choice(tuple(neighbors))
-        if training_graph.GetNI(random_neighbor).GetDeg() < 2:
-            continue
-
-        # Remove edge
-        training_graph.DelEdge(node, random_neighbor)
-        removed_edges.add((node, random_neighbor))
-        num_edges_to_remove -= 1
-    return removed_edges
+def validate_all(edges, scores_by_name, names, num_pairs=None, results_file=None):
+    """
+    Evaluate the top-K lists returned by train_all() and print them as one
+    table, in the order of names. If results_file is given, the table is
+    also written there as CSV, which plot.read_recalls() reads.
+    """
+    header = ['heuristic', 'TP', 'FP', 'FN', 'precision', 'recall', 'average_precision', 'auc']
+    table = []
+    for name in names:
+        scores = scores_by_name[name]
+        results = evaluation.evaluate(list(edges), [node_pair for node_pair, score in scores],
+                                      [score for node_pair, score in scores], num_pairs)
+        TP, FP, FN = results['TP'], results['FP'], results['FN']
+        table.append([name, TP, FP, FN, TP * 100.0 / max(TP + FP, 1), TP * 100.0 / max(TP + FN, 1),
+                      results['average_precision'], results['auc']])
+    print('{0:32s} {1:>8s} {2:>8s} {3:>8s} {4:>8s}'.format('Heuristic', 'Prec (%)', 'Rec (%)', 'AP', 'AUC'))
+    for row in table:
+        print('{0:32s} {1:8.2f} {2:8.2f} {3:8.4f} {4:8.4f}'.format(row[0], row[4], row[5], row[6], row[7]))
+    if results_file:
+        with open(results_file, 'w') as file:
+            file.write(','.join(header) + '\n')
+            for row in table:
+                file.write(','.join(str(value) for value in row) + '\n')
+        print('Results written to {}'.format(results_file))
+    return table
+
+def holdout_edges(src, dst, seed=None, split_file=None, num_folds=1, fold=0):
+    """
+    Return a boolean mask of the test edges among the edges (src[i], dst[i]).
+    By default a seeded 20% of the edges is held out (Train: 80%, Test:
+    20%); with num_folds > 1, fold selects one of the disjoint folds. If
+    split_file exists, the split saved there is reused, otherwise it is
+    written there.
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    if split_file and os.path.exists(split_file):
+        print('Loading train/test split from {}'.format(split_file))
+        saved_src, saved_dst, folds = holdout.load_split(split_file)
+        assert np.array_equal(saved_src, src) and np.array_equal(saved_dst, dst), \
+            'Split in {} was made for a different graph'.format(split_file)
+    else:
+        folds = holdout.assign_folds(src, dst, num_folds, 0.2, seed)
+        if split_file:
+            holdout.save_split(split_file, src, dst, folds, seed, num_folds)
+    return folds == fold
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Link prediction on the Foursquare checkins graph.')
+    parser.add_argument('--dataset', metavar='DIR',
+                        help='load the graph from a binary dataset written by processCheckIns.py')
+    parser.add_argument('--user-ids', metavar='PATH',
+                        help='sorted user id array (.npy) telling users from venues in the text edge list')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed of the train/test split')
+    parser.add_argument('--split-file', metavar='PATH',
+                        help='reuse the train/test split saved at PATH, or save it there')
+    parser.add_argument('--folds', type=int, default=1,
+                        help='number of disjoint test folds')
+    parser.add_argument('--fold', type=int, default=0,
+                        help='test fold used in this run')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes used for scoring')
+    parser.add_argument('--two-hop-index', metavar='PATH',
+                        help='load (or build and save) the two-hop co-occurrence index at PATH')
+    parser.add_argument('--katz-beta', type=float, default=0.005,
+                        help='damping factor of the Katz heuristic')
+    parser.add_argument('--katz-max-length', type=int, default=3,
+                        help='longest path counted by the Katz heuristic')
+    parser.add_argument('--max-distance', type=int, default=None,
+                        help='depth cap of the distance heuristic')
+    parser.add_argument('--radius', type=int, default=None,
+                        help='only score venues within this many hops of each user')
+    parser.add_argument('--far-samples', type=int, default=0,
+                        help='number of random venues beyond --radius also scored per user')
+    parser.add_argument('--stats-file', metavar='PATH',
+                        help='write per-stage timings and counters to PATH as JSON')
+    parser.add_argument('--profile-dir', metavar='DIR',
+                        help='write a cProfile dump of every stage to DIR')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='record the peak memory of every stage with tracemalloc')
+    parser.add_argument('--score-cache', metavar='DIR',
+                        help='reuse score blocks cached in DIR for the same training graph and heuristic')
+    parser.add_argument('--score-cache-mb', type=int, default=1024,
+                        help='disk budget of --score-cache in MB; least recently used blocks are evicted')
+    parser.add_argument('--all-heuristics', action='store_true',
+                        help='score and validate all heuristics in one pass instead of SCORE_FN')
+    parser.add_argument('--results-file', metavar='PATH', default='results.csv',
+                        help='CSV table of the --all-heuristics results, read by plot.py')
+    parser.add_argument('--social-graph', metavar='PATH',
+                        help='socialgraph.tsv from other/processDataset.py, for the friend heuristics')
+    parser.add_argument('--ratings', metavar='PATH',
+                        help='ratings.tsv from other/processDataset.py, for the friend heuristics')
+    parser.add_argument('--tsv-user-offset', type=int, default=loader.MAX_USER_ID,
+                        help='max user id that processDataset.py added to the user ids of its .tsv files')
+    parser.add_argument('--weighted', action='store_true',
+                        help='weight edges by their number of checkins, for the weighted heuristics')
+    parser.add_argument('--checkin-counts', metavar='PATH',
+                        help='edge list with one line per checkin (e.g. checkins.txt) giving the '
+                             '--weighted edge weights; by default those of --dataset are used')
+    parser.add_argument('--minhash', type=int, metavar='NUM_HASHES', default=None,
+                        help='estimate the common neighbor and Adamic/Adar heuristics from '
+                             'MinHash sketches of NUM_HASHES hashes per node')
+    parser.add_argument('--minhash-report', type=int, metavar='NUM_PAIRS', default=0,
+                        help='print the error of the --minhash estimates vs the exact values '
+                             'on a random sample of up to NUM_PAIRS test edges, drawn with --seed')
+    parser.add_argument('--lsh-index', metavar='PATH',
+                        help='only score the venues sharing a MinHash LSH bucket with a venue of '
+                             'each user, using (or building and saving) the index at PATH')
+    parser.add_argument('--lsh-bands', type=int, default=32,
+                        help='number of bands of the --lsh-index signatures')
+    parser.add_argument('--lsh-rows', type=int, default=2,
+                        help='number of hashes per band of the --lsh-index signatures; venues of '
+                             'Jaccard similarity above about (1 / bands) ** (1 / rows) are '
+                             'retrieved, so more rows prune more pairs but miss more test edges')
+    parser.add_argument('--venues', metavar='PATH',
+                        help='venues.tsv written by other/processDataset.py, giving the venue '
+                             'coordinates for the geo_distance heuristic and --geo-radius')
+    parser.add_argument('--geo-radius', type=float, metavar='KM', default=None,
+                        help='only score the venues within KM km of the centroid of each '
+                             "user's venues (needs --venues)")
+    args = parser.parse_args()
+    if args.folds < 1 or not 0 <= args.fold < args.folds:
+        parser.error('--fold must be between 0 and --folds - 1')
+    if args.split_file and os.path.exists(args.split_file):
+        num_folds, seed = holdout.split_params(args.split_file)
+        if num_folds != args.folds:
+            parser.error('{} holds a {}-fold split, not --folds {}'.format(
+                args.split_file, num_folds, args.folds))
+        if args.seed is not None and seed != args.seed:
+            parser.error('{} was split with seed {}, not --seed {}'.format(
+                args.split_file, seed, args.seed))
+    if args.weighted and not (args.dataset or args.checkin_counts):
+        parser.error('--weighted needs --dataset or --checkin-counts')
+    if args.all_heuristics and (args.two_hop_index or args.minhash):
+        parser.error('--two-hop-index and --minhash only apply to per-pair scoring, '
+                     'not --all-heuristics')
+    # Per-pair scoring takes a single neighbor dict type; the blocks of
+    # --all-heuristics read relations, weights and locations from the matrix
+    neighbor_dicts = [name for name, given in (
+        ('--two-hop-index', args.two_hop_index),
+        ('--social-graph/--ratings', args.social_graph or args.ratings),
+        ('--weighted', args.weighted),
+        ('--venues', args.venues),
+        ('--minhash', args.minhash)) if given]
+    if len(neighbor_dicts) > 1 and not args.all_heuristics:
+        parser.error('{} can only be combined with --all-heuristics'.format(', '.join(neighbor_dicts)))
+    if args.lsh_index and args.radius is not None:
+        parser.error('--lsh-index cannot be combined with --radius')
+    if args.geo_radius is not None and not args.venues:
+        parser.error('--geo-radius needs --venues')
+    if args.geo_radius is not None and (args.radius is not None or args.lsh_index):
+        parser.error('--geo-radius cannot be combined with --radius or --lsh-index')
+    if args.minhash_report and not args.minhash:
+        parser.error('--minhash-report needs --minhash')
+    return args
 
 def main():
+    args = parse_args()
     score_fns = {
         0: heuristics.random_predictor,
         1: heuristics.distance,
@@ -75,47 +367,216 @@ def main():
         4: heuristics.adamic_adar_user,
         5: heuristics.adamic_adar_venue,
         6: heuristics.preferential_attachment,
-        7: heuristics.katz
+        7: heuristics.katz,
+        8: heuristics.friend_checkins,    # needs --social-graph
+        9: heuristics.friend_ratings,     # needs --social-graph and --ratings
+        10: heuristics.weighted_common_neighbors_user,  # needs --weighted
+        11: heuristics.weighted_adamic_adar_user,       # needs --weighted
+        12: heuristics.weighted_katz,                   # needs --weighted
+        13: heuristics.geo_distance                     # needs --venues
     }
     SCORE_FN = score_fns[0]
-    training_graph = load_graph('../data/processed/sampled_checkins.txt')
-    edges = remove_edges(training_graph)
-    users, venues = split_user_venues(training_graph)
-    neighbor_dict = create_neighbor_dict(training_graph)
-    scores = train(training_graph, users, venues, SCORE_FN, neighbor_dict)
-    validate(edges, scores)
+    PARAMS = {
+        'random_predictor': {'seed': args.seed or 0},
+        'katz': {'beta': args.katz_beta, 'max_length': args.katz_max_length},
+        'weighted_katz': {'beta': args.katz_beta, 'max_length': args.katz_max_length},
+        'distance': {'max_depth': args.max_distance},
+    }
+    SCORE_PARAMS = PARAMS.get(SCORE_FN.__name__, {})
+    USE_SPARSE = True # Score blocks of users with sparse_scoring when possible
+    TOP_K = 0.2       # Predict the top 20% of all (user, venue) pairs
+    instr = instrumentation.Instrumentation(args.profile_dir, args.trace_memory)
+    user_ids = None
+    dataset = None
+    with instr.stage('load_graph'):
+        # Training structures are built from the edge arrays, a SNAP graph
+        # only if pairs are scored one at a time
+        if args.dataset:
+            dataset = load_dataset(args.dataset)
+            user_ids = dataset.user_ids
+            src, dst = dataset.edge_users, dataset.edge_venues
+            node_ids = dataset.node_ids
+        else:
+            src, dst = load_edge_list('../data/processed/sampled_checkins.txt')
+            if args.user_ids:
+                user_ids = id_sets.load_ids(args.user_ids)
+            node_ids = np.unique(np.concatenate((src, dst)))
+        training_graph = None
+    with instr.stage('remove_edges'):
+        test = holdout_edges(src, dst, args.seed, args.split_file, args.folds, args.fold)
+        edges = set(zip(src[test].tolist(), dst[test].tolist()))
+        train_src, train_dst = src[~test], dst[~test]
+    with instr.stage('split_user_venues'):
+        users, venues = split_user_venues(node_ids, user_ids)
+    with instr.stage('create_neighbor_dict'):
+        neighbor_dict = adjacency.CSRAdjacency.from_edges(train_src, train_dst, node_ids)
+        hetero = None
+        if args.social_graph or args.ratings:
+            hetero = load_relations(neighbor_dict, users, args.social_graph, args.ratings,
+                                    args.tsv_user_offset)
+        if args.weighted:
+            weighted_edges = load_edge_weights(dataset, args.checkin_counts)
+        if args.venues:
+            locations = geo_index.VenueLocations(*loader.read_venue_locations(args.venues))
+            print('Number of located venues: {}'.format(len(locations.venue_ids)))
+        # Outside --all-heuristics, at most one of these is given (see parse_args())
+        if not args.all_heuristics:
+            if args.two_hop_index:
+                neighbor_dict = cooccurrence.load_or_build(args.two_hop_index, neighbor_dict)
+            if hetero is not None:
+                neighbor_dict = hetero
+            if args.weighted:
+                neighbor_dict = adjacency.WeightedAdjacency.from_adjacency(neighbor_dict, *weighted_edges)
+            if args.venues:
+                neighbor_dict = geo_index.GeoAdjacency.from_adjacency(neighbor_dict, locations)
+            if args.minhash:
+                neighbor_dict = minhash.MinHashIndex.from_adjacency(neighbor_dict, args.minhash,
+                                                                    args.seed or 0)
+    if args.minhash or args.two_hop_index:
+        # The block scorers do not use the neighbor dict: MinHash estimates and
+        # two-hop index lookups are per pair
+        USE_SPARSE = False
+    matrix = None
+    candidate_pairs = None
+    if (USE_SPARSE or args.radius is not None or args.lsh_index or args.geo_radius is not None
+            or args.all_heuristics):
+        with instr.stage('build_matrix'):
+            matrix = sparse_scoring.BipartiteMatrix.from_edges(train_src, train_dst, users, venues)
+            if hetero is not None:
+                matrix.add_relations(hetero)
+            if args.weighted:
+                matrix.set_weights(*weighted_edges)
+            if args.venues:
+                matrix.set_locations(locations)
+    if args.radius is not None:
+        candidate_pairs = candidates.CandidatePairs(matrix, args.radius, args.far_samples, args.seed)
+    if args.lsh_index:
+        with instr.stage('lsh_index'):
+            candidate_pairs = lsh_index.load_or_build(args.lsh_index, matrix, args.lsh_bands,
+                                                      args.lsh_rows, args.seed or 0)
+    if args.geo_radius is not None:
+        candidate_pairs = geo_index.GeoCandidates(matrix, args.geo_radius)
+    cache = None
+    if args.score_cache:
+        cache = score_cache.ScoreCache(args.score_cache, args.score_cache_mb * 1024 * 1024)
+    instrumentation.count('nodes', len(neighbor_dict))
+    instrumentation.count('train_edges', len(train_src))
+    instrumentation.count('test_edges', len(edges))
+    if args.all_heuristics:
+        fns = [score_fns[i] for i in sorted(score_fns)
+               if i < 8 or (i < 10 and hetero is not None)
+               or (10 <= i < 13 and args.weighted) or (i == 13 and args.venues)]
+        with instr.stage('train'):
+            scores = train_all(users, venues, fns, matrix, TOP_K, args.workers, PARAMS, candidate_pairs,
+                               cache)
+        with instr.stage('validate'):
+            validate_all(edges, scores, [fn.__name__ for fn in fns], len(users) * len(venues),
+                         args.results_file)
+    else:
+        if training_graph is None and not (matrix is not None and USE_SPARSE
+                                           and sparse_scoring.has_block_fn(SCORE_FN)):
+            with instr.stage('build_graph'):
+                training_graph = loader.build_graph(train_src, train_dst)
+        with instr.stage('train'):
+            scores = train(training_graph, users, venues, SCORE_FN, neighbor_dict,
+                           matrix if USE_SPARSE else None, TOP_K, args.workers, SCORE_PARAMS,
+                           candidate_pairs, cache)
+        with instr.stage('validate'):
+            validate(edges, scores, len(users) * len(venues))
+    if cache is not None and args.workers > 1:
+        # Workers only count the blocks they stored themselves
+        cache.evict()
+    if args.minhash_report:
+        with instr.stage('minhash_report'):
+            fns = [heuristics.num_common_neighbors_user, heuristics.num_common_neighbors_venue,
+                   heuristics.adamic_adar_user, heuristics.adamic_adar_venue]
+            # Venue ids are above the user ids
+            pairs = sorted((min(edge), max(edge)) for edge in edges)
+            sample = np.random.RandomState(args.seed or 0).choice(
+                len(pairs), min(args.minhash_report, len(pairs)), replace=False)
+            pairs = [pairs[i] for i in sorted(sample)]
+            report = minhash.error_report(neighbor_dict, pairs, fns, training_graph)
+            minhash.print_error_report(report, args.minhash)
+    instr.summary()
+    if args.stats_file:
+        instr.dump(args.stats_file)
 
 #*******************************************************************************
 # Helper functions
 #*******************************************************************************
 
-def load_graph(input_filename):
-    graph = snap.LoadEdgeList(snap.PUNGraph, input_filename, 0, 1)
-    print('Number of nodes: {}'.format(graph.GetNodes()))
-    print('Number of edges: {}'.format(graph.GetEdges()))
-    return graph
+def load_edge_list(input_filename):
+    """
+    (src, dst) arrays of the distinct edges of an edge list file, with the
+    smaller id first and sorted by edge, as in a binary dataset.
+    """
+    src, dst, counts = loader.aggregate_edges(*loader.read_edge_list(input_filename))
+    print('Number of nodes: {}'.format(len(np.unique(np.concatenate((src, dst))))))
+    print('Number of edges: {}'.format(len(src)))
+    return src, dst
+
+def load_dataset(directory):
+    """
+    Open a binary dataset (see dataset_cache.py).
+    """
+    dataset = dataset_cache.open_dataset(directory)
+    print('Number of nodes: {}'.format(dataset.meta['num_nodes']))
+    print('Number of edges: {}'.format(dataset.meta['num_edges']))
+    return dataset
 
-def split_user_venues(graph):
-    MAX_USER_ID = 2153502
-    users = set()
-    venues = set()
-    for node in graph.Nodes():
-        id = node.GetId()
-        if id <= MAX_USER_ID:
-            users.add(id)
-        else:
-            venues.add(id)
-    return users, venues
+def load_relations(adjacency, users, social_graph=None, ratings=None,
+                   user_offset=loader.MAX_USER_ID):
+    """
+    Add the friendships and ratings read from the .tsv files written by
+    other/processDataset.py to the checkins adjacency.
+    """
+    friend_src, friend_dst = hetero_graph.EMPTY, hetero_graph.EMPTY
+    rating_users, rating_venues, rating_values = hetero_graph.EMPTY, hetero_graph.EMPTY, hetero_graph.EMPTY
+    if social_graph:
+        friend_src, friend_dst = loader.read_social_graph(social_graph, user_offset)
+    if ratings:
+        rating_users, rating_venues, rating_values = loader.read_ratings(ratings, user_offset)
+    hetero = hetero_graph.HeteroAdjacency.from_adjacency(
+        adjacency, users, friend_src, friend_dst, rating_users, rating_venues, rating_values)
+    print('Number of friendships: {}'.format(hetero.friends.offsets[-1] // 2))
+    print('Number of ratings: {}'.format(len(hetero.raters)))
+    return hetero
+
+def load_edge_weights(dataset=None, checkin_counts=None):
+    """
+    Return (src, dst, weights) of the weighted edges: read from the
+    checkin list checkin_counts if given, where repeat checkins add up,
+    else the edge weights of dataset.
+    """
+    if checkin_counts:
+        return loader.aggregate_edges(*loader.read_edge_list(checkin_counts))
+    if dataset.edge_weights is None:
+        raise ValueError('dataset has no edge_weights.npy, rewrite it or use --checkin-counts')
+    return dataset.edge_users, dataset.edge_venues, dataset.edge_weights
+
+def split_user_venues(node_ids, user_ids=None):
+    """
+    Split the sorted array node_ids into sorted lists of users and venues.
+    user_ids is a sorted array of user ids (see id_sets.py), e.g. a
+    dataset's user_ids.npy; without it, ids up to MAX_USER_ID are users.
+    """
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    if user_ids is None:
+        is_user = node_ids <= loader.MAX_USER_ID
+    else:
+        is_user = id_sets.contains(user_ids, node_ids)
+    return node_ids[is_user].tolist(), node_ids[~is_user].tolist()
 
 def create_neighbor_dict(graph):
     """
     Create a cache of the neighbors of all nodes in the graph
-    to speed up score calculations.
+    to speed up score calculations. Neighbors are sorted by id so that
+    ties are broken in the same order as in sparse_scoring.
     """
     neighbor_dict = {}
     for node in graph.Nodes():
         node_id = node.GetId()
-        neighbors = tuple(get_neighbors(node))
+        neighbors = tuple(sorted(get_neighbors(node)))
         neighbor_dict[node_id] = neighbors
     assert len(neighbor_dict) == graph.GetNodes()
     return neighbor_dict
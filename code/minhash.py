@@ -0,0 +1,184 @@
+"""
+minhash.py
+----------
+Approximate common neighbors from MinHash sketches of neighborhoods.
+
+For every node, num_hashes random hash functions h(j) = (a * j + b) mod p
+are applied to the dense indices of its neighbors and the minimum of
+each is kept. Two nodes get the same minimum for a hash function with
+probability equal to the Jaccard similarity J of their neighborhoods, so
+J is estimated as the fraction of equal minima, and the overlap as
+J / (1 + J) * (degree(x) + degree(y)), in O(num_hashes) whatever the
+degrees. Since h is a bijection on [0, p), a shared minimum also gives
+back a uniform sample of the common neighbors, which estimates the mean
+Adamic/Adar weight of the intersection.
+
+MinHashIndex can be passed to the heuristics anywhere a CSRAdjacency is
+accepted; the common neighbor and Adamic/Adar heuristics then return
+estimates. error_report() compares the estimates with the exact values.
+"""
+
+import numpy as np
+from adjacency import CSRAdjacency
+
+PRIME = (1 << 31) - 1
+EMPTY = -1
+
+
+class MinHashIndex(CSRAdjacency):
+
+    def __init__(self, node_ids, offsets, indices, num_hashes=64, seed=0, signatures=None):
+        CSRAdjacency.__init__(self, node_ids, offsets, indices)
+        self.a, self.b = hash_functions(num_hashes, seed)
+        self.a_inverse = np.array([pow(int(a), PRIME - 2, PRIME) for a in self.a], dtype=np.int64)
+        if signatures is None:
+            signatures = min_hashes(offsets, indices, self.a, self.b)
+        self.signatures = signatures
+        weights = np.zeros(len(self.degrees))
+        mask = self.degrees > 1
+        weights[mask] = 1.0 / np.log(self.degrees[mask])
+        self.adamic_adar_weights = weights
+
+    @classmethod
+    def from_adjacency(cls, adjacency, num_hashes=64, seed=0):
+        return cls(adjacency.node_ids, adjacency.offsets, adjacency.indices, num_hashes, seed)
+
+    @property
+    def num_hashes(self):
+        return len(self.a)
+
+    def jaccard(self, x, y):
+        """
+        Estimated Jaccard similarity of the neighborhoods of node ids x and y.
+        """
+        return float(self._jaccard(self.index(x), np.array([self.index(y)]))[0])
+
+    def common(self, x, y):
+        """
+        Estimated number of common neighbors of node ids x and y.
+        """
+        i, j = self.index(x), np.array([self.index(y)])
+        return float(self._overlap(i, j, self._jaccard(i, j))[0])
+
+    def max_common(self, x, y):
+        """
+        Estimate of max |N(x) intersect N(z)| over all z in N(y), as
+        CooccurrenceIndex.max_common().
+        """
+        i, candidates = self.index(x), self.neighbor_indices(self.index(y))
+        if len(candidates) == 0:
+            return 0.0
+        return float(self._overlap(i, candidates, self._jaccard(i, candidates)).max())
+
+    def max_common_weight(self, x, y):
+        """
+        Estimated Adamic/Adar sum of N(x) intersect N(z) for the z in N(y)
+        with the largest estimated intersection: the estimated overlap
+        times the mean weight of the sampled common neighbors.
+        """
+        i, candidates = self.index(x), self.neighbor_indices(self.index(y))
+        if len(candidates) == 0:
+            return 0.0
+        matches = self._matches(i, candidates)
+        overlap = self._overlap(i, candidates, matches.mean(axis=1))
+        best = int(np.argmax(overlap))
+        if not matches[best].any():
+            return 0.0
+        hashes = self.signatures[i, matches[best]].astype(np.int64)
+        # Invert h to get the common neighbor that reached each shared minimum
+        common = ((hashes - self.b[matches[best]]) % PRIME * self.a_inverse[matches[best]]) % PRIME
+        return float(overlap[best] * self.adamic_adar_weights[common].mean())
+
+    def _matches(self, i, candidates):
+        matches = self.signatures[candidates] == self.signatures[i]
+        if self.degrees[i] == 0:
+            matches[:] = False
+        matches[self.degrees[candidates] == 0] = False
+        return matches
+
+    def _jaccard(self, i, candidates):
+        return self._matches(i, candidates).mean(axis=1)
+
+    def _overlap(self, i, candidates, jaccard):
+        return jaccard / (1 + jaccard) * (self.degrees[i] + self.degrees[candidates])
+
+
+def hash_functions(num_hashes, seed=0):
+    """
+    Coefficients a, b of num_hashes hash functions h(j) = (a * j + b) mod p.
+    """
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, PRIME, size=num_hashes).astype(np.int64)
+    b = rng.randint(0, PRIME, size=num_hashes).astype(np.int64)
+    return a, b
+
+
+def min_hashes(offsets, indices, a, b):
+    """
+    (num rows x len(a)) int32 array of the minimum hash of the indices in
+    every row of a CSR structure, or EMPTY for empty rows.
+    """
+    signatures = np.full((len(offsets) - 1, len(a)), EMPTY, dtype=np.int32)
+    nonempty = np.flatnonzero(np.diff(offsets) > 0)
+    if len(nonempty) == 0:
+        return signatures
+    starts = offsets[nonempty]
+    indices = np.asarray(indices, dtype=np.int64)
+    for h in range(len(a)):
+        values = (a[h] * indices + b[h]) % PRIME
+        signatures[nonempty, h] = np.minimum.reduceat(values, starts)
+    return signatures
+
+
+def error_report(index, pairs, score_fns, graph=None):
+    """
+    Compare the estimates of score_fns computed with index against their
+    exact values, on (user, venue) pairs such as the held-out test edges.
+    Also compares the estimated Jaccard similarity of each venue with the
+    other venues of its user. Returns a dict of error statistics per name.
+    """
+    exact = CSRAdjacency(index.node_ids, index.offsets, index.indices, index.degrees)
+    pairs = [(u, v) for u, v in pairs if u in index and v in index]
+    report = {}
+    for score_fn in score_fns:
+        exact_scores = np.array([score_fn(graph, u, v, exact) for u, v in pairs], dtype=np.float64)
+        estimates = np.array([score_fn(graph, u, v, index) for u, v in pairs], dtype=np.float64)
+        report[score_fn.__name__] = _errors(exact_scores, estimates)
+    exact_jaccard, estimated_jaccard = [], []
+    for u, v in pairs:
+        j = index.index(v)
+        for k in index.neighbor_indices(index.index(u)):
+            if k == j:
+                continue
+            a, b = exact.neighbor_indices(j), exact.neighbor_indices(k)
+            common = len(exact.intersect(a, b))
+            exact_jaccard.append(common / float(len(a) + len(b) - common))
+            estimated_jaccard.append(index._jaccard(j, np.array([k]))[0])
+    report['jaccard'] = _errors(np.array(exact_jaccard), np.array(estimated_jaccard))
+    return report
+
+
+def print_error_report(report, num_hashes):
+    print('MinHash estimates ({} hashes) vs exact values'.format(num_hashes))
+    print('{0:30s} {1:>8s} {2:>12s} {3:>10s} {4:>10s} {5:>10s}'.format(
+        'Heuristic', 'Pairs', 'Exact mean', 'MAE', 'Rel. error', 'Max error'))
+    for name in sorted(report):
+        errors = report[name]
+        print('{0:30s} {1:8d} {2:12.4f} {3:10.4f} {4:10.4f} {5:10.4f}'.format(
+            name, errors['num_pairs'], errors['exact_mean'], errors['mean_absolute_error'],
+            errors['mean_relative_error'], errors['max_error']))
+
+
+def _errors(exact, estimates):
+    if len(exact) == 0:
+        return {'num_pairs': 0, 'exact_mean': 0.0, 'mean_absolute_error': 0.0,
+                'mean_relative_error': 0.0, 'max_error': 0.0}
+    errors = np.abs(estimates - exact)
+    nonzero = exact != 0
+    return {
+        'num_pairs': len(exact),
+        'exact_mean': float(exact.mean()),
+        'mean_absolute_error': float(errors.mean()),
+        'mean_relative_error': float((errors[nonzero] / np.abs(exact[nonzero])).mean()) if nonzero.any() else 0.0,
+        'max_error': float(errors.max()),
+    }
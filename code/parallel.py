@@ -0,0 +1,60 @@
+"""
+parallel.py
+-----------
+Score (user, venue) pairs in a pool of worker processes.
+
+The sorted user list is split into contiguous shards. Workers are forked
+after the graph, neighbor cache and biadjacency matrix are built, so they
+read those structures through copy-on-write pages instead of receiving a
+pickled copy per task. Each worker returns only its shard's top-K pairs,
+numbered by their global position, so the merged result does not depend
+on the number of workers. Shard bounds are multiples of block_size, so
+the shards split the users into the same score blocks (and score cache
+entries) whatever the number of workers. The instrumentation counters of
+each shard are sent back with its selector and added to the parent's.
+"""
+
+import multiprocessing
+import instrumentation
+import topk
+
+_shard_fn = None
+_shard_args = None
+
+
+def score_in_shards(shard_fn, args, num_users, k, workers, shards_per_worker=4, selector=None,
+                    block_size=1):
+    """
+    Call shard_fn(*args, lo, hi) for contiguous user ranges [lo, hi) in
+    worker processes and merge the returned TopKSelectors into selector,
+    an empty TopKSelector(k) by default. lo and hi are multiples of
+    block_size, except for the last hi.
+    """
+    global _shard_fn, _shard_args
+    _shard_fn, _shard_args = shard_fn, args
+    num_blocks = -(-num_users // block_size)
+    num_shards = max(1, min(num_blocks, workers * shards_per_worker))
+    bounds = [min(num_users, block_size * (num_blocks * i // num_shards))
+              for i in range(num_shards + 1)]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    if selector is None:
+        selector = topk.TopKSelector(k)
+    pool = multiprocessing.get_context('fork').Pool(workers)
+    try:
+        for i, (shard, counters) in enumerate(pool.imap_unordered(_score_shard, ranges)):
+            selector.merge(shard)
+            instrumentation.add_counts(counters)
+            print('Shards complete: {}/{}'.format(i + 1, num_shards))
+    finally:
+        pool.close()
+        pool.join()
+        _shard_fn, _shard_args = None, None
+    return selector
+
+
+def _score_shard(user_range):
+    lo, hi = user_range
+    # Drop the counters inherited from the parent or left by the last shard
+    instrumentation.take_counts()
+    shard = _shard_fn(*(_shard_args + (lo, hi)))
+    return shard, instrumentation.take_counts()
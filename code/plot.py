@@ -1,10 +1,32 @@
+import csv
+import sys
 import matplotlib.pyplot as plt
 
-def plot(recalls):
+LABELS = {
+    'random_predictor': 'Random Predictor',
+    'distance': 'Distance',
+    'num_common_neighbors_user': 'Common Neighbors (user)',
+    'num_common_neighbors_venue': 'Common Neighbors (venue)',
+    'adamic_adar_user': 'Adamic/Adar (user)',
+    'adamic_adar_venue': 'Adamic/Adar (venue)',
+    'preferential_attachment': 'Preferential Attachment',
+    'katz': 'Katz (beta=0.005)',
+    'friend_checkins': 'Friend Checkins',
+    'friend_ratings': 'Friend Ratings',
+    'weighted_common_neighbors_user': 'Weighted Common Neighbors (user)',
+    'weighted_adamic_adar_user': 'Weighted Adamic/Adar (user)',
+    'weighted_katz': 'Weighted Katz (beta=0.005)',
+    'geo_distance': 'Geographic Distance',
+}
+
+def plot(recalls, names=None):
     """
     Plot the relative performance of link prediction methods compared to baseline random predictor.
+    names are the heuristic names of the recalls, by default the first eight heuristics.
     """
-    heuristics = ['Random Predictor', 'Distance', 'Common Neighbors (user)', 'Common Neighbors (venue)', 'Adamic/Adar (user)', 'Adamic/Adar (venue)', 'Preferential Attachment', 'Katz (beta=0.005)']
+    if names is None:
+        names = ['random_predictor', 'distance', 'num_common_neighbors_user', 'num_common_neighbors_venue', 'adamic_adar_user', 'adamic_adar_venue', 'preferential_attachment', 'katz']
+    heuristics = [LABELS.get(name, name) for name in names]
     baseline = recalls[0]
     relative_performance = [float(value)/baseline for value in recalls]
     plt.grid(b=True, alpha=0.3)
@@ -18,7 +40,20 @@ def plot(recalls):
     plt.ylim((bot_lim, top_lim))
     plt.show()
 
+def read_recalls(filename):
+    """
+    Read the heuristic names and recall column (in %) of a results table
+    written by main.py --all-heuristics.
+    """
+    with open(filename) as file:
+        rows = list(csv.DictReader(file))
+    return [float(row['recall']) for row in rows], [row['heuristic'] for row in rows]
+
 def main():
+    if len(sys.argv) > 1:
+        for filename in sys.argv[1:]:
+            plot(*read_recalls(filename))
+        return
     recalls = [
         [18.14, 4.88, 6.51, 20.93, 7.44, 20.23, 22.56, 10],
         [20.59, 14.78, 20.18, 41.59, 20.29, 42.1, 39.25, 35.68],
@@ -37,9 +37,16 @@ at least some degree X. Below are some metrics calculated:
 """
 
 from enum import Enum
-import cPickle as pickle
 import os
+import numpy as np
 import snap
+import dataset_cache
+import id_sets
+import loader
+from adjacency import CSRAdjacency
+from loader import MAX_USER_ID
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 
 '''
 Checks whether coordinates point to a location in California.
@@ -48,13 +55,13 @@ Input:  Accepts two strings for long and lat.
 Returns: False if None or empty string.
 '''
 
-MAX_USER_ID = 2153502   # pre-computed
 SPLIT_TRAIN_TEST = False # Set to False to get only one output file
+PRINT_CORE_TABLE = False # Set to True to print the degree > 1..8 table
 
 class Filetype(Enum):
     DAT = 0,
-    PICKLE = 1,
-    TXT = 2
+    TXT = 2,
+    NPY = 3
 
 
 class Datafile(Enum):
@@ -63,8 +70,9 @@ class Datafile(Enum):
     SAMPLE_CKNS_TXT = 2,
     TEST_TXT = 3,
     TRAIN_TXT = 4,
-    USERS_PICKLE = 5,
-    VENUES_PICKLE = 6
+    USER_IDS_NPY = 5,
+    VENUE_IDS_NPY = 6,
+    SAMPLE_CKNS_NPY = 7
 
 
 Datafiles = {
@@ -73,8 +81,9 @@ Datafiles = {
     Datafile.SAMPLE_CKNS_TXT : '../../data/processed/sampled_checkins.txt',
     Datafile.TEST_TXT        : '../../data/test/test.txt',
     Datafile.TRAIN_TXT       : '../../data/training/train.txt',
-    Datafile.USERS_PICKLE    : '../../data/pickles/user_ids.pickle',
-    Datafile.VENUES_PICKLE   : '../../data/pickles/venue_ids.pickle',
+    Datafile.USER_IDS_NPY    : '../../data/ids/user_ids.npy',
+    Datafile.VENUE_IDS_NPY   : '../../data/ids/venue_ids.npy',
+    Datafile.SAMPLE_CKNS_NPY : '../../data/processed/sampled_checkins/',
 }
 
 
@@ -104,9 +113,9 @@ def writeFile(filename, data, filetype, header=None):
                     else:
                         file.write('{} '.format(elem))
 
-    elif filetype == Filetype.PICKLE:
-        with open(filename, 'w') as file:
-            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+    # Sorted array of ids, see id_sets.py
+    elif filetype == Filetype.NPY:
+        id_sets.save_ids(filename, data)
 
     else:
         print 'Filetype not recognized! No file written'
@@ -120,26 +129,14 @@ def print_metrics(users, venues):
 
 
 def read_input(input_filename, MAX_USER_ID):
-    user_venue_edges = []
-    users, venues = set(), set()
-    with open(input_filename, 'r') as input:
-        for i, line in enumerate(input):
-            parsed = [str.strip() for str in line.split('|')]
-            if i <= 1 or len(parsed) < 6:
-                #  print('skipped: {}'.format(parsed))
-                continue
-            user_id = int(parsed[1])
-            venue_id = int(parsed[2]) + MAX_USER_ID
-            users.add(user_id)
-            venues.add(venue_id)
-            user_venue_edges.append((user_id, venue_id))
-
-    writeFile(Datafiles[Datafile.USERS_PICKLE], users, Filetype.PICKLE)
-    writeFile(Datafiles[Datafile.VENUES_PICKLE], venues, Filetype.PICKLE)
+    userIds, venueIds = loader.read_checkins_dat(input_filename, MAX_USER_ID)
+    users, venues = id_sets.to_id_array(userIds), id_sets.to_id_array(venueIds)
+    writeFile(Datafiles[Datafile.USER_IDS_NPY], users, Filetype.NPY)
+    writeFile(Datafiles[Datafile.VENUE_IDS_NPY], venues, Filetype.NPY)
 
     #  print_metrics(users, venues)
-    assert(len(users.intersection(venues)) == 0)
-    return user_venue_edges
+    assert(not id_sets.contains(users, venues).any())
+    return zip(userIds.tolist(), venueIds.tolist())
 
 
 def splitTrainTest(edges, percent_train):
@@ -159,30 +156,101 @@ def splitTrainTest(edges, percent_train):
 # Filters out nodes that don't have at least degree minDeg
 # Returns: list of edges (src node, dst node)
 def sampleDatasetBFS(edgeList, minDeg):
-    Graph = snap.LoadConnList(snap.PNGraph, edgeList)
-    G = snap.GetMxWcc(Graph)
-    while True:
-        nodesToDel = snap.TIntV()
-        for n in G.Nodes():
-            if n.GetDeg() <= minDeg:
-                nodesToDel.Add(n.GetId())
-        if nodesToDel.Len() == 0:
-            break
-        snap.DelNodes(G, nodesToDel)
-    nodes, edges = G.GetNodes(), G.GetEdges()
-
-    numUsers, numVenues = 0, 0
-    for n in G.Nodes():
-        if n.GetInDeg() == 0:
-            numUsers += 1
-        else:
-            numVenues += 1
-
-    print '# of nodes: {}, # of edges: {}'.format(G.GetNodes(), G.GetEdges())
-    print '# of users: {}, # of venues: {}'.format(numUsers, numVenues)
-    print 'isConnected = {}'.format(snap.IsConnected(G))
-    edges = [(e.GetSrcNId(), e.GetDstNId()) for e in G.Edges()]
-    return edges
+    adjacency, core, inWcc = loadCoreNumbers(edgeList)
+    keep = inWcc & (core > minDeg)
+    nodeIds = adjacency.node_ids
+    isUser = nodeIds <= MAX_USER_ID
+    src, dst = getEdges(adjacency, keep)
+    userSide = isUser[src]
+    users = np.where(userSide, nodeIds[src], nodeIds[dst])
+    venues = np.where(userSide, nodeIds[dst], nodeIds[src])
+
+    print '# of nodes: {}, # of edges: {}'.format(keep.sum(), len(src))
+    print '# of users: {}, # of venues: {}'.format(
+            (keep & isUser).sum(), (keep & ~isUser).sum())
+    print 'isConnected = {}'.format(isConnected(adjacency, keep))
+    return zip(users.tolist(), venues.tolist())
+
+
+# Computes the core number of every node in the largest weakly connected
+# component of the checkins graph in a single run. The nodes left by
+# sampleDatasetBFS(edgeList, minDeg) are exactly those with core > minDeg.
+# Returns: (CSRAdjacency, core numbers, boolean mask of the max WCC)
+def loadCoreNumbers(edgeList):
+    src, dst = loader.read_edge_list(edgeList)
+    adjacency = CSRAdjacency.from_edges(src, dst)
+    numComponents, labels = connected_components(getMatrix(adjacency), directed=False)
+    inWcc = labels == np.argmax(np.bincount(labels))
+    return adjacency, computeCoreNumbers(adjacency), inWcc
+
+
+# Queue-driven k-core peeling (Batagelj & Zaversnik): nodes are processed
+# once in increasing order of their current degree, and removing a node
+# decrements its neighbors' degrees by moving them one bucket down. This
+# replaces repeatedly rescanning the graph and deleting low degree nodes.
+def computeCoreNumbers(adjacency):
+    deg = adjacency.degrees.tolist()
+    offsets = adjacency.offsets.tolist()
+    indices = adjacency.indices.tolist()
+    n = len(deg)
+    if n == 0:
+        return np.zeros(0, dtype=np.int32)
+    # vert: nodes sorted by degree, pos: position of each node in vert,
+    # binStart[d]: position in vert of the first node with degree d
+    vert = np.argsort(adjacency.degrees, kind='stable').tolist()
+    pos = [0] * n
+    for i, v in enumerate(vert):
+        pos[v] = i
+    binStart = np.searchsorted(adjacency.degrees[vert], np.arange(max(deg) + 1)).tolist()
+    for i in range(n):
+        v = vert[i]
+        for u in indices[offsets[v]:offsets[v + 1]]:
+            if deg[u] > deg[v]:
+                du, pu = deg[u], pos[u]
+                pw = binStart[du]
+                w = vert[pw]
+                if u != w:
+                    vert[pu], vert[pw] = w, u
+                    pos[u], pos[w] = pw, pu
+                binStart[du] += 1
+                deg[u] -= 1
+    return np.array(deg, dtype=np.int32)
+
+
+# Prints the DATASET REDUCTION table in the module docstring from a single
+# core number computation.
+def printCoreTable(edgeList, maxDeg=8):
+    adjacency, core, inWcc = loadCoreNumbers(edgeList)
+    isUser = adjacency.node_ids <= MAX_USER_ID
+    for minDeg in range(1, maxDeg + 1):
+        keep = inWcc & (core > minDeg)
+        src, dst = getEdges(adjacency, keep)
+        print 'Degree > {} : {:6d} nodes, {:6d} edges : {:6d} users, {:5d} venues'.format(
+                minDeg, keep.sum(), len(src), (keep & isUser).sum(), (keep & ~isUser).sum())
+
+
+# Returns: arrays of dense (src, dst) indices of the edges between kept nodes,
+# each undirected edge listed once
+def getEdges(adjacency, keep):
+    src = np.repeat(np.arange(len(adjacency.degrees)), adjacency.degrees)
+    dst = adjacency.indices
+    mask = (src < dst) & keep[src] & keep[dst]
+    return src[mask], dst[mask]
+
+
+def getMatrix(adjacency):
+    n = len(adjacency.node_ids)
+    data = np.ones(len(adjacency.indices), dtype=np.int8)
+    return csr_matrix((data, adjacency.indices, adjacency.offsets), shape=(n, n))
+
+
+def isConnected(adjacency, keep):
+    nodes = np.flatnonzero(keep)
+    if len(nodes) == 0:
+        return True
+    numComponents, labels = connected_components(
+            getMatrix(adjacency)[nodes][:, nodes], directed=False)
+    return numComponents == 1
 
 
 # Returned a set of venues that user has checked in to.
@@ -210,11 +278,22 @@ def main():
     # print 'Writing all checkins to {}'.format(Datafiles[Datafile.CHECKINS_TXT])
     # writeFile(Datafiles[Datafile.CHECKINS_TXT], edges, Filetype.TXT)
 
+    if PRINT_CORE_TABLE:
+        printCoreTable(Datafiles[Datafile.CHECKINS_TXT])
+
     MIN_DEGREE = 7
     sampleEdges = sampleDatasetBFS(Datafiles[Datafile.CHECKINS_TXT], MIN_DEGREE)
     print 'Writing sampled checkins to {}'.format(
             Datafiles[Datafile.SAMPLE_CKNS_TXT])
     writeFile(Datafiles[Datafile.SAMPLE_CKNS_TXT], sampleEdges, Filetype.TXT)
+    print 'Writing binary dataset to {}'.format(
+            Datafiles[Datafile.SAMPLE_CKNS_NPY])
+    src, dst = zip(*sampleEdges)
+    # Number of checkins of every sampled edge, from the repeats in checkins.txt
+    weightedSrc, weightedDst, counts = loader.aggregate_edges(
+            *loader.read_edge_list(Datafiles[Datafile.CHECKINS_TXT]))
+    weights = loader.lookup_weights(src, dst, weightedSrc, weightedDst, counts)
+    dataset_cache.write_dataset(Datafiles[Datafile.SAMPLE_CKNS_NPY], src, dst, MAX_USER_ID, weights)
     if SPLIT_TRAIN_TEST:
         print 'Splitting into train/test sets...'
         trainData, testData = splitTrainTest(sampleEdges, 0.8)
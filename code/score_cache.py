@@ -0,0 +1,120 @@
+"""
+score_cache.py
+--------------
+Persistent cache of computed score blocks.
+
+A block of scores is stored under a key made of a fingerprint of the
+training graph, the heuristic name, its parameters (e.g. Katz beta) and
+the user rows it covers, as a compressed .npz file. Re-running with a
+different cutoff or for plotting then reloads the blocks instead of
+re-scoring. When the cache grows past its disk budget, the least
+recently used blocks are deleted.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def graph_fingerprint(matrix):
+    """
+    Hash of a sparse_scoring.BipartiteMatrix: its user and venue ids, the
+    structure of its edges and its friendships, ratings, edge weights and
+    venue locations, if any.
+    """
+    digest = hashlib.sha1()
+    arrays = [matrix.users, matrix.venues, matrix.csr.indptr, matrix.csr.indices]
+    for relation in (getattr(matrix, 'friends', None), getattr(matrix, 'ratings', None)):
+        if relation is not None:
+            arrays.extend([relation.indptr, relation.indices])
+            digest.update(np.ascontiguousarray(relation.data, dtype=np.float64).tobytes())
+    if getattr(matrix, 'weighted_csr', None) is not None:
+        digest.update(np.ascontiguousarray(matrix.weighted_csr.data, dtype=np.float64).tobytes())
+    if getattr(matrix, 'venue_points', None) is not None:
+        digest.update(np.ascontiguousarray(matrix.venue_points, dtype=np.float64).tobytes())
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+class ScoreCache(object):
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Size of the cached blocks, scanned once and then kept up to date
+        # by store(); evict() rescans the directory only once it is over
+        # budget. Forked workers each count their own blocks.
+        self.num_bytes = sum(size for mtime, size, path in self._entries())
+
+    def key(self, fingerprint, heuristic, params, lo, hi):
+        description = json.dumps({
+            'graph': fingerprint,
+            'heuristic': heuristic,
+            'params': params,
+            'rows': [int(lo), int(hi)],
+        }, sort_keys=True)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def load(self, key):
+        """
+        Return the cached block for key, or None.
+        """
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as file:
+                block = np.load(file)['scores']
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        # Mark as recently used
+        os.utime(filename, None)
+        return block
+
+    def store(self, key, block):
+        filename = self._filename(key)
+        temp_filename = filename + '.{}.tmp'.format(os.getpid())
+        with open(temp_filename, 'wb') as file:
+            np.savez_compressed(file, scores=block)
+        size = os.path.getsize(temp_filename)
+        replaced = os.path.getsize(filename) if os.path.exists(filename) else 0
+        os.rename(temp_filename, filename)
+        self.num_bytes += size - replaced
+        if self.num_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used blocks until the cache fits its budget.
+        """
+        entries = self._entries()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.num_bytes = total
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + '.npz')
@@ -0,0 +1,466 @@
+"""
+sparse_scoring.py
+-----------------
+Vectorized scoring engine for the bipartite user-venue graph.
+
+The biadjacency matrix B (users x venues) is built once from the SNAP graph.
+Scores are then computed for whole blocks of users at a time with sparse
+matrix products instead of one Python call per (user, venue) pair.
+
+Users and venues are indexed in ascending id order, which is also the
+iteration order of the sorted neighbor tuples in main.create_neighbor_dict(),
+so ties in the max-over-neighbors heuristics are broken the same way as in
+heuristics.py. Adamic/Adar sums may differ from the scalar versions in the
+last bits because the terms are added in a different order.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+import bfs
+import geo_index
+import loader
+import id_sets
+import instrumentation
+import score_cache
+
+# Number of users scored together in one block
+BLOCK_SIZE = 128
+
+
+class BipartiteMatrix(object):
+    """
+    Biadjacency matrix of the training graph plus the degree and
+    Adamic/Adar weight vectors shared by the block scorers.
+    """
+
+    def __init__(self, graph, users, venues):
+        src, dst = [], []
+        for EI in graph.Edges():
+            src.append(EI.GetSrcNId())
+            dst.append(EI.GetDstNId())
+        self._build(src, dst, users, venues)
+
+    @classmethod
+    def from_edges(cls, src, dst, users, venues):
+        """
+        Build the matrix from edge arrays (e.g. from loader.py) without a
+        SNAP graph.
+        """
+        matrix = cls.__new__(cls)
+        matrix._build(src, dst, users, venues)
+        return matrix
+
+    def _build(self, src, dst, users, venues):
+        self.users = np.array(sorted(users), dtype=np.int64)
+        self.venues = np.array(sorted(venues), dtype=np.int64)
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        src_is_user = np.isin(src, self.users)
+        user_ids = np.where(src_is_user, src, dst)
+        venue_ids = np.where(src_is_user, dst, src)
+        rows = np.searchsorted(self.users, user_ids)
+        cols = np.searchsorted(self.venues, venue_ids)
+        shape = (len(self.users), len(self.venues))
+        data = np.ones(len(rows), dtype=np.float64)
+        self.csr = sp.csr_matrix((data, (rows, cols)), shape=shape)
+        # Repeated edges count once, as in the SNAP graph
+        self.csr.sum_duplicates()
+        self.csr.data[:] = 1
+        self.csr.sort_indices()
+        self.csc = self.csr.tocsc()
+        self.csc.sort_indices()
+        self.user_degrees = np.diff(self.csr.indptr).astype(np.float64)
+        self.venue_degrees = np.diff(self.csc.indptr).astype(np.float64)
+        self.user_weights = _adamic_adar_weights(self.user_degrees)
+        self.venue_weights = _adamic_adar_weights(self.venue_degrees)
+
+    def add_relations(self, hetero):
+        """
+        Add the friendships and ratings of a hetero_graph.HeteroAdjacency
+        as self.friends (users x users) and self.ratings (users x venues)
+        sparse matrices, used by the friend_* block scorers.
+        """
+        users, friends = hetero.friend_edges()
+        self.friends = self._relation_matrix(users, friends, np.ones(len(users)), self.users)
+        users, venues, ratings = hetero.rating_edges()
+        self.ratings = self._relation_matrix(users, venues, ratings, self.venues)
+
+    def set_weights(self, src, dst, weights):
+        """
+        Weight the edges, e.g. by number of checkins, for the weighted_*
+        block scorers: self.weighted_csr has the structure of csr and the
+        weight of every edge (src[i], dst[i]), or 1 for other edges.
+        """
+        rows = np.repeat(np.arange(self.num_users), np.diff(self.csr.indptr))
+        data = loader.lookup_weights(self.users[rows], self.venues[self.csr.indices], src, dst, weights)
+        self.weighted_csr = sp.csr_matrix((data, self.csr.indices.copy(), self.csr.indptr.copy()),
+                                          shape=self.csr.shape)
+        strengths = np.asarray(self.weighted_csr.sum(axis=0)).ravel()
+        self.venue_strength_weights = _adamic_adar_weights(strengths)
+
+    def set_locations(self, locations):
+        """
+        Set the venue coordinates (a geo_index.VenueLocations) for
+        geo_distance_block() and geo_index.GeoCandidates: self.venue_points
+        has the unit vector of every venue, or zeros if it has none.
+        """
+        self.venue_points = locations.points(self.venues)
+
+    def _relation_matrix(self, src, dst, values, col_ids):
+        keep = id_sets.contains(self.users, src) & id_sets.contains(col_ids, dst)
+        rows = np.searchsorted(self.users, src[keep])
+        cols = np.searchsorted(col_ids, dst[keep])
+        matrix = sp.csr_matrix((values[keep], (rows, cols)), shape=(self.num_users, len(col_ids)))
+        matrix.sort_indices()
+        return matrix
+
+    @property
+    def num_users(self):
+        return self.csr.shape[0]
+
+    @property
+    def num_venues(self):
+        return self.csr.shape[1]
+
+    def user_blocks(self, block_size, lo=0, hi=None):
+        """
+        Yield arrays of consecutive user row indices in [lo, hi). Blocks
+        are aligned to multiples of block_size, so the same rows form the
+        same blocks however users are split into shards.
+        """
+        hi = self.num_users if hi is None else hi
+        start = lo
+        while start < hi:
+            end = min((start // block_size + 1) * block_size, hi)
+            yield np.arange(start, end)
+            start = end
+
+
+#*******************************************************************************
+# Block scorers: each returns a dense (len(rows) x num_venues) score array
+#*******************************************************************************
+
+def random_block(matrix, rows, seed=0):
+    """
+    Random predictor. Each user's row is drawn from a generator seeded by
+    (seed, user id), as in heuristics.random_predictor(), so the scores do
+    not depend on how users are split into blocks or shards.
+    """
+    out = np.empty((len(rows), matrix.num_venues))
+    for i, user in enumerate(matrix.users[rows].tolist()):
+        out[i] = np.random.RandomState([seed, user]).randint(0, 2, size=matrix.num_venues)
+    return out
+
+
+def distance_block(matrix, rows, max_depth=None):
+    """
+    Negative of the shortest path distance, from a bit-parallel BFS over
+    up to 64 users at a time. Pairs farther apart than max_depth score
+    -(max_depth + 1).
+    """
+    out = np.empty((len(rows), matrix.num_venues))
+    for start in range(0, len(rows), bfs.NUM_BITS):
+        sources = rows[start:start + bfs.NUM_BITS]
+        out[start:start + len(sources)] = bfs.bipartite_distances(
+            matrix.csr, matrix.csc, sources, max_depth)
+    return -out
+
+
+def num_common_neighbors_user_block(matrix, rows):
+    """
+    max(N(user) intersect N(user_i)) for all user_i in N(venue)
+    """
+    overlap = (matrix.csr[rows] * matrix.csr.T).toarray()
+    return _segment_max(overlap, matrix.csc.indptr, matrix.csc.indices)
+
+
+def num_common_neighbors_venue_block(matrix, rows):
+    """
+    max(N(venue) intersect N(venue_i)) for all venue_i in N(user)
+    """
+    sub = matrix.csr[rows]
+    # overlap[v, k] = |N(v) intersect N(venue_k)| for the k-th venue of the block
+    overlap = (matrix.csc.T * matrix.csc[:, sub.indices]).toarray()
+    return _segment_max(overlap, sub.indptr, np.arange(len(sub.indices))).T
+
+
+def adamic_adar_user_block(matrix, rows):
+    """
+    Weighted common neighbors over the user_i with the largest intersection
+    """
+    sub = matrix.csr[rows]
+    overlap = (sub * matrix.csr.T).toarray()
+    weighted = (sub * sp.diags(matrix.venue_weights) * matrix.csr.T).toarray()
+    return _segment_take_first_max(overlap, weighted,
+                                   matrix.csc.indptr, matrix.csc.indices)
+
+
+def adamic_adar_venue_block(matrix, rows):
+    """
+    Weighted common neighbors over the venue_i with the largest intersection
+    """
+    sub = matrix.csr[rows]
+    neighbor_cols = matrix.csc[:, sub.indices]
+    overlap = (matrix.csc.T * neighbor_cols).toarray()
+    weighted = (matrix.csc.T * sp.diags(matrix.user_weights) * neighbor_cols).toarray()
+    positions = np.arange(len(sub.indices))
+    return _segment_take_first_max(overlap, weighted, sub.indptr, positions).T
+
+
+def preferential_attachment_block(matrix, rows):
+    """
+    Degree(x) * Degree(y)
+    """
+    return np.outer(matrix.user_degrees[rows], matrix.venue_degrees)
+
+
+def katz_block(matrix, rows, beta=0.005, max_length=3):
+    """
+    Katz (Exponentially Damped Path Counts) for path lengths 1 to max_length:
+    sum of beta^l * A^l over user rows and venue columns. Only odd-length
+    paths connect a user to a venue, and those are B (B^T B)^((l - 1) / 2).
+    """
+    paths = matrix.csr[rows]
+    score = beta * paths
+    for path_length in range(3, max_length + 1, 2):
+        paths = paths * matrix.csr.T * matrix.csr
+        score = score + beta**path_length * paths
+    return score.toarray()
+
+
+def friend_checkins_block(matrix, rows):
+    """
+    Number of friends of the user who checked in at the venue: F[rows] * B
+    """
+    return (matrix.friends[rows] * matrix.csr).toarray()
+
+
+def friend_ratings_block(matrix, rows):
+    """
+    Sum of the ratings of the venue by friends of the user: F[rows] * R
+    """
+    return (matrix.friends[rows] * matrix.ratings).toarray()
+
+
+def geo_distance_block(matrix, rows):
+    """
+    Negative great-circle distance in km between the venue and the
+    centroid of the user's venues
+    """
+    return -geo_index.distances_km(geo_index.user_centroids(matrix, rows), matrix.venue_points)
+
+
+def _weighted_overlap(matrix, rows, venue_weights=None):
+    """
+    (W[rows] B^T + B[rows] W^T) / 2, with the venue columns scaled by
+    venue_weights if given.
+    """
+    W, B = matrix.weighted_csr, matrix.csr
+    scale = sp.diags(venue_weights) if venue_weights is not None else sp.identity(matrix.num_venues)
+    return ((W[rows] * scale * B.T + B[rows] * scale * W.T) * 0.5).toarray()
+
+
+def weighted_common_neighbors_user_block(matrix, rows):
+    """
+    max over user_i in N(venue) of the weighted common neighbors
+    """
+    return _segment_max(_weighted_overlap(matrix, rows), matrix.csc.indptr, matrix.csc.indices)
+
+
+def weighted_adamic_adar_user_block(matrix, rows):
+    """
+    Weighted Adamic/Adar over the user_i with the largest weighted overlap
+    """
+    return _segment_take_first_max(
+        _weighted_overlap(matrix, rows), _weighted_overlap(matrix, rows, matrix.venue_strength_weights),
+        matrix.csc.indptr, matrix.csc.indices)
+
+
+def weighted_katz_block(matrix, rows, beta=0.005, max_length=3):
+    """
+    Katz over weighted paths: W (W^T W)^((l - 1) / 2) for odd l
+    """
+    W = matrix.weighted_csr
+    paths = W[rows]
+    score = beta * paths
+    for path_length in range(3, max_length + 1, 2):
+        paths = paths * W.T * W
+        score = score + beta**path_length * paths
+    return score.toarray()
+
+
+BLOCK_SCORE_FNS = {
+    'random_predictor': random_block,
+    'distance': distance_block,
+    'num_common_neighbors_user': num_common_neighbors_user_block,
+    'num_common_neighbors_venue': num_common_neighbors_venue_block,
+    'adamic_adar_user': adamic_adar_user_block,
+    'adamic_adar_venue': adamic_adar_venue_block,
+    'preferential_attachment': preferential_attachment_block,
+    'katz': katz_block,
+    'friend_checkins': friend_checkins_block,
+    'friend_ratings': friend_ratings_block,
+    'weighted_common_neighbors_user': weighted_common_neighbors_user_block,
+    'weighted_adamic_adar_user': weighted_adamic_adar_user_block,
+    'weighted_katz': weighted_katz_block,
+    'geo_distance': geo_distance_block,
+}
+
+
+def all_heuristics_block(matrix, rows, names, score_params=None):
+    """
+    Score blocks of several heuristics for the same rows, as a dict keyed
+    by heuristic name. The sparse products they have in common are
+    computed once per block: the user overlap B[rows] B^T (common
+    neighbors and Adamic/Adar over users, and the length-3 Katz paths) and
+    the venue overlap between every venue and the rows' venues (common
+    neighbors and Adamic/Adar over venues). score_params maps heuristic
+    names to their keyword arguments.
+    """
+    score_params = score_params or {}
+    names = set(names)
+    sub = matrix.csr[rows]
+    blocks = {}
+    if names & set(['num_common_neighbors_user', 'adamic_adar_user', 'katz']):
+        user_paths = sub * matrix.csr.T
+    if names & set(['num_common_neighbors_user', 'adamic_adar_user']):
+        overlap = user_paths.toarray()
+        if 'num_common_neighbors_user' in names:
+            blocks['num_common_neighbors_user'] = _segment_max(
+                overlap, matrix.csc.indptr, matrix.csc.indices)
+        if 'adamic_adar_user' in names:
+            weighted = (sub * sp.diags(matrix.venue_weights) * matrix.csr.T).toarray()
+            blocks['adamic_adar_user'] = _segment_take_first_max(
+                overlap, weighted, matrix.csc.indptr, matrix.csc.indices)
+    if names & set(['num_common_neighbors_venue', 'adamic_adar_venue']):
+        neighbor_cols = matrix.csc[:, sub.indices]
+        overlap = (matrix.csc.T * neighbor_cols).toarray()
+        positions = np.arange(len(sub.indices))
+        if 'num_common_neighbors_venue' in names:
+            blocks['num_common_neighbors_venue'] = _segment_max(overlap, sub.indptr, positions).T
+        if 'adamic_adar_venue' in names:
+            weighted = (matrix.csc.T * sp.diags(matrix.user_weights) * neighbor_cols).toarray()
+            blocks['adamic_adar_venue'] = _segment_take_first_max(
+                overlap, weighted, sub.indptr, positions).T
+    if 'katz' in names:
+        params = score_params.get('katz', {})
+        beta = params.get('beta', 0.005)
+        score = beta * sub
+        paths = sub
+        for path_length in range(3, params.get('max_length', 3) + 1, 2):
+            paths = (user_paths if path_length == 3 else paths * matrix.csr.T) * matrix.csr
+            score = score + beta**path_length * paths
+        blocks['katz'] = score.toarray()
+    for name in names - set(blocks):
+        blocks[name] = BLOCK_SCORE_FNS[name](matrix, rows, **score_params.get(name, {}))
+    return blocks
+
+
+def has_block_fn(score_fn):
+    return score_fn.__name__ in BLOCK_SCORE_FNS
+
+
+def score_blocks(matrix, score_fn, block_size=BLOCK_SIZE, lo=0, hi=None, score_params=None, cache=None):
+    """
+    Yield (user ids, score block) for every block of users with row index
+    in [lo, hi), where the score block has one column per venue in
+    matrix.venues. score_params are passed to the block scorer as keyword
+    arguments, as they are to score_fn in the per-pair path. If a
+    score_cache.ScoreCache is given, blocks are read from it when present
+    and stored in it otherwise.
+    """
+    block_fn = BLOCK_SCORE_FNS[score_fn.__name__]
+    score_params = score_params or {}
+    if cache is not None:
+        fingerprint = score_cache.graph_fingerprint(matrix)
+    for rows in matrix.user_blocks(block_size, lo, hi):
+        if cache is None:
+            yield matrix.users[rows], block_fn(matrix, rows, **score_params)
+            continue
+        key = cache.key(fingerprint, score_fn.__name__, score_params, rows[0], rows[-1] + 1)
+        block = cache.load(key)
+        if block is None:
+            block = block_fn(matrix, rows, **score_params)
+            cache.store(key, block)
+            instrumentation.count('score_cache_misses')
+        else:
+            instrumentation.count('score_cache_hits')
+        yield matrix.users[rows], block
+
+
+def score_all_blocks(matrix, names, block_size=BLOCK_SIZE, lo=0, hi=None, score_params=None, cache=None):
+    """
+    Like score_blocks(), for several heuristics at once: yield (user ids,
+    dict of score blocks keyed by heuristic name). Blocks are cached under
+    the same keys as in score_blocks(), and only the heuristics missing
+    from the cache are computed.
+    """
+    score_params = score_params or {}
+    if cache is not None:
+        fingerprint = score_cache.graph_fingerprint(matrix)
+    for rows in matrix.user_blocks(block_size, lo, hi):
+        if cache is None:
+            yield matrix.users[rows], all_heuristics_block(matrix, rows, names, score_params)
+            continue
+        keys = dict((name, cache.key(fingerprint, name, score_params.get(name, {}), rows[0],
+                                     rows[-1] + 1)) for name in names)
+        blocks = {}
+        for name in names:
+            block = cache.load(keys[name])
+            if block is not None:
+                blocks[name] = block
+                instrumentation.count('score_cache_hits')
+        missing = [name for name in names if name not in blocks]
+        if missing:
+            blocks.update(all_heuristics_block(matrix, rows, missing, score_params))
+            for name in missing:
+                cache.store(keys[name], blocks[name])
+                instrumentation.count('score_cache_misses')
+        yield matrix.users[rows], blocks
+
+
+#*******************************************************************************
+# Helper functions
+#*******************************************************************************
+
+def _adamic_adar_weights(degrees):
+    weights = np.zeros(len(degrees))
+    mask = degrees > 1
+    weights[mask] = 1.0 / np.log(degrees[mask])
+    return weights
+
+
+def _segment_max(values, indptr, indices):
+    """
+    out[:, j] = max(values[:, indices[indptr[j]:indptr[j+1]]]), or 0 for an
+    empty segment.
+    """
+    out = np.zeros((values.shape[0], len(indptr) - 1))
+    starts, nonempty = _nonempty_starts(indptr)
+    if len(starts) > 0:
+        out[:, nonempty] = np.maximum.reduceat(values[:, indices], starts, axis=1)
+    return out
+
+
+def _segment_take_first_max(values, taken, indptr, indices):
+    """
+    For each segment, out[:, j] = taken at the first position in the
+    segment where values is largest, or 0 for an empty segment.
+    """
+    out = np.zeros((values.shape[0], len(indptr) - 1))
+    starts, nonempty = _nonempty_starts(indptr)
+    if len(starts) == 0:
+        return out
+    gathered = values[:, indices]
+    seg_max = np.maximum.reduceat(gathered, starts, axis=1)
+    seg_ids = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(indices))))
+    positions = np.arange(len(indices))
+    candidates = np.where(gathered == seg_max[:, seg_ids], positions, len(indices))
+    first = np.minimum.reduceat(candidates, starts, axis=1)
+    out[:, nonempty] = np.take_along_axis(taken[:, indices], first, axis=1)
+    return out
+
+
+def _nonempty_starts(indptr):
+    nonempty = np.diff(indptr) > 0
+    return indptr[:-1][nonempty], nonempty
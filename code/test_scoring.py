@@ -0,0 +1,57 @@
+"""
+test_scoring.py
+---------------
+Consistency checks of the block scoring paths. Run with pytest from the
+code/ directory.
+"""
+
+import os
+import numpy as np
+import heuristics
+import loader
+import parallel
+import score_cache
+import sparse_scoring
+import topk
+from adjacency import CSRAdjacency
+
+
+def random_matrix(num_users=500, num_venues=40, num_edges=3000, seed=0):
+    rng = np.random.RandomState(seed)
+    users = np.arange(1, num_users + 1)
+    venues = loader.MAX_USER_ID + np.arange(1, num_venues + 1)
+    return sparse_scoring.BipartiteMatrix.from_edges(
+        rng.choice(users, num_edges), rng.choice(venues, num_edges), users, venues)
+
+
+def cached_shard(matrix, score_fn, cache, k, lo, hi):
+    selector = topk.TopKSelector(k, start=lo * matrix.num_venues)
+    for block_users, block in sparse_scoring.score_blocks(matrix, score_fn, lo=lo, hi=hi, cache=cache):
+        selector.push_block(block_users, matrix.venues, block)
+    return selector
+
+
+def test_score_cache_shared_across_workers(tmp_path):
+    matrix = random_matrix()
+    cache = score_cache.ScoreCache(str(tmp_path))
+    num_blocks = -(-matrix.num_users // sparse_scoring.BLOCK_SIZE)
+    args = (matrix, heuristics.num_common_neighbors_user, cache, 100)
+    results = []
+    for workers in (2, 3):
+        selector = parallel.score_in_shards(cached_shard, args, matrix.num_users, 100, workers,
+                                            block_size=sparse_scoring.BLOCK_SIZE)
+        results.append(selector.result())
+        # Every worker count stores the same blocks, so the second run only hits
+        assert len(os.listdir(str(tmp_path))) == num_blocks
+    assert results[0] == results[1]
+
+
+def test_random_predictor_matches_random_block():
+    matrix = random_matrix(num_users=50)
+    rows, cols = matrix.csr.nonzero()
+    src, dst = matrix.users[rows], matrix.venues[cols]
+    adjacency = CSRAdjacency.from_edges(src, dst, np.concatenate((matrix.users, matrix.venues)))
+    block = sparse_scoring.random_block(matrix, np.arange(matrix.num_users), seed=3)
+    pairs = [[heuristics.random_predictor(None, u, v, adjacency, seed=3) for v in matrix.venues.tolist()]
+             for u in matrix.users.tolist()]
+    assert (block == np.array(pairs)).all()
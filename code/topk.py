@@ -0,0 +1,161 @@
+"""
+topk.py
+-------
+Bounded top-K selection over streamed score blocks.
+
+Only the K best (user, venue) pairs seen so far are kept, so memory is
+O(K + block size) instead of O(|users| * |venues|). Ties are broken by
+insertion order, which gives the same result as a stable descending sort
+of the full score list followed by taking the first K entries.
+"""
+
+import numpy as np
+
+
+def resolve_k(k, num_pairs):
+    """
+    Turn K given as a fraction in (0, 1] or as an absolute count into a
+    number of pairs.
+    """
+    if isinstance(k, float):
+        assert 0 < k <= 1
+        return int(num_pairs * k)
+    return min(int(k), num_pairs)
+
+
+class TopKSelector(object):
+    """
+    Pairs are numbered in the order they are pushed, starting at start.
+    Selectors over disjoint, consecutive ranges of that numbering can be
+    combined with merge().
+    """
+
+    def __init__(self, k, start=0):
+        self.k = k
+        self.num_seen = start
+        self.num_pushed = 0
+        self.threshold = None
+        self.num_pending = 0
+        self.pending = []
+        self.users = np.zeros(0, dtype=np.int64)
+        self.venues = np.zeros(0, dtype=np.int64)
+        self.scores = np.zeros(0, dtype=np.float64)
+        self.order = np.zeros(0, dtype=np.int64)
+
+    def push(self, users, venues, scores, order=None):
+        """
+        Add a batch of scored pairs given as three equal-length arrays.
+        order optionally gives the pairs' numbers explicitly, e.g. their
+        position among all pairs when only some pairs are scored.
+        """
+        scores = np.asarray(scores, dtype=np.float64).ravel()
+        if order is None:
+            order = np.arange(self.num_seen, self.num_seen + len(scores))
+        order = np.asarray(order, dtype=np.int64)
+        if len(order) > 0:
+            self.num_seen = max(self.num_seen, int(order.max()) + 1)
+        self.num_pushed += len(scores)
+        users = np.asarray(users, dtype=np.int64).ravel()
+        venues = np.asarray(venues, dtype=np.int64).ravel()
+        if self.threshold is not None:
+            # Later pairs lose ties, so they must beat the current K-th score
+            keep = scores > self.threshold
+            users, venues, scores, order = users[keep], venues[keep], scores[keep], order[keep]
+        if len(scores) == 0:
+            return
+        self.pending.append((users, venues, scores, order))
+        self.num_pending += len(scores)
+        # Compacting only once the buffer reaches K keeps the work amortized O(1) per pair
+        if self.num_pending >= max(self.k, 1):
+            self._compact()
+
+    def push_block(self, block_users, block_venues, block):
+        """
+        Add a (len(block_users) x len(block_venues)) score block, read in
+        row-major order.
+        """
+        users = np.repeat(block_users, len(block_venues))
+        venues = np.tile(block_venues, len(block_users))
+        self.push(users, venues, block)
+
+    def merge(self, other):
+        """
+        Add the pairs kept by another selector, keeping their numbering.
+        """
+        other._compact()
+        self.pending.append((other.users, other.venues, other.scores, other.order))
+        self.num_pending += len(other.scores)
+        self.num_seen = max(self.num_seen, other.num_seen)
+        self.num_pushed += other.num_pushed
+        self._compact()
+
+    def result(self):
+        """
+        Return the kept pairs as a list of ((u, v), score) sorted by
+        decreasing score.
+        """
+        self._compact()
+        ranked = np.lexsort((self.order, -self.scores))
+        return [((u, v), score) for u, v, score in zip(
+            self.users[ranked].tolist(), self.venues[ranked].tolist(),
+            self.scores[ranked].tolist())]
+
+    def _compact(self):
+        if not self.pending:
+            return
+        users, venues, scores, order = zip(*self.pending)
+        self.users = np.concatenate((self.users,) + users)
+        self.venues = np.concatenate((self.venues,) + venues)
+        self.scores = np.concatenate((self.scores,) + scores)
+        self.order = np.concatenate((self.order,) + order)
+        self.pending = []
+        self.num_pending = 0
+        if len(self.scores) >= self.k:
+            keep = _select(self.scores, self.order, self.k)
+            self.users = self.users[keep]
+            self.venues = self.venues[keep]
+            self.scores = self.scores[keep]
+            self.order = self.order[keep]
+            if self.k > 0:
+                self.threshold = self.scores.min()
+
+
+class TopKSelectors(object):
+    """
+    One TopKSelector per name, e.g. per heuristic when several are scored
+    in the same pass. Merged name by name.
+    """
+
+    def __init__(self, names, k, start=0):
+        self.names = list(names)
+        self.selectors = dict((name, TopKSelector(k, start)) for name in self.names)
+
+    def __getitem__(self, name):
+        return self.selectors[name]
+
+    @property
+    def num_pushed(self):
+        return max([selector.num_pushed for selector in self.selectors.values()] + [0])
+
+    def merge(self, other):
+        for name in self.names:
+            self.selectors[name].merge(other.selectors[name])
+
+    def result(self):
+        """
+        Return a dict of TopKSelector.result() lists keyed by name.
+        """
+        return dict((name, self.selectors[name].result()) for name in self.names)
+
+
+def _select(scores, order, k):
+    """
+    Indices of the k best entries, by score and then by insertion order.
+    """
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)
+    ties = ties[np.argsort(order[ties], kind='stable')][:k - len(above)]
+    return np.concatenate((above, ties))
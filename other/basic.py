@@ -1,6 +1,6 @@
 import snap
 import matplotlib.pyplot as plt
-import cPickle as pickle
+import numpy as np
 from collections import defaultdict, Counter
 from pprint import pprint
 
@@ -35,8 +35,9 @@ def train(graph, users, venues, score_fn):
     for item in sorted(scores, key=lambda x: x[1], reverse=True):
         print(item)
 
-    with open('scores.pickle', 'w') as file:
-        pickle.dump(scores, file, protocol=pickle.HIGHEST_PROTOCOL)
+    pairs = np.array([pair for pair, score in scores], dtype=np.int64).reshape(-1, 2)
+    np.savez('scores.npz', users=pairs[:, 0], venues=pairs[:, 1],
+             scores=np.array([score for pair, score in scores], dtype=np.float64))
 
 #*******************************************************************************
 # Score functions
@@ -71,12 +72,10 @@ def get_neighbors(NI):
         neighbors.add(neighbor_node_id)
     return neighbors
 
-def load_pickles(users_pickle, venues_pickle):
-    # Load user IDs and venue IDs sets from pickle objects
-    with open('user_ids.pickle', 'r') as file:
-        users = pickle.load(file)
-    with open('venue_ids.pickle', 'r') as file:
-        venues = pickle.load(file)
+def load_ids(users_file, venues_file):
+    # Load user IDs and venue IDs saved as sorted arrays (.npy), memory-mapped
+    users = np.load(users_file, mmap_mode='r')
+    venues = np.load(venues_file, mmap_mode='r')
     return users, venues
 
 def load_graph(input_filename):
@@ -105,13 +104,13 @@ def get_nodes_in_max_wcc(graph):
 
 def main():
     #  checkins_txt = 'checkins.txt'
-    #  users_pickle = 'users_ids.pickle'
-    #  venues_pickle = 'venue_ids.pickle'
+    #  users_file = 'user_ids.npy'
+    #  venues_file = 'venue_ids.npy'
     checkins_file = 'checkinsTrunc.txt'
-    users_pickle = 'users_ids_trunc.pickle'
-    venues_pickle = 'venue_ids_trunc.pickle'
+    users_file = 'user_ids_trunc.npy'
+    venues_file = 'venue_ids_trunc.npy'
 
-    users, venues = load_pickles(users_pickle, venues_pickle)
+    users, venues = load_ids(users_file, venues_file)
 
     score_fn = get_distance
     #  score_fn = get_num_common_neighbors
@@ -120,7 +119,8 @@ def main():
 
     print_connected_components(graph)
     plot_degree_distribution(graph)
-    train(graph, users, venues, score_fn)
+    # snap expects Python ints
+    train(graph, users.tolist(), venues.tolist(), score_fn)
 
 if __name__ == '__main__':
     main()
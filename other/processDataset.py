@@ -5,18 +5,28 @@ and outputs .tsv files to directory umn_foursquare_datasets
 
 Instructions:
 1) Download the dataset folder from the link above
-2) Run script: python processDataset.py
-    ~5 minutes
+2) Run script: python processDataset.py [number of processes]
 3) Import .tsv files into snap
 
 Note:
 UserID: UserIDs and VenueIDs overlap. To resolve this, the max UserID is
 recorded in the global maxUserID and added to every UserID in each file.
+
+Each file is split into byte-range chunks at line boundaries, and the
+chunks of all five files are parsed in parallel in a process pool, each
+into its own part file. The max UserID is found while users.dat is parsed,
+so the files run in two stages: users and venues first, then socialgraph,
+checkins and ratings (which need the max UserID), together with adding the
+offset to the parsed user parts. The parts are then concatenated in order.
 '''
 
 import csv
-import string
+import multiprocessing
+import os
 import re
+import shutil
+import string
+import sys
 
 exclude = string.punctuation
 path = './umn_foursquare_datasets/'
@@ -42,155 +52,137 @@ headers = {
         outFiles[4]: ['userId', 'venueId', 'rating'],
         }
 
-MAX_USER_ID = -1
-
-def processUsers():
-    print 'Processing Users...'
-    global MAX_USER_ID
-    # Get max user id
-    with open(path + datFiles[0]) as f:
-        line = f.readline()
-        count = 0
-        while line:
-            splitLine = re.sub('\s+[\|]\s+', '\t', line).split()
-            if (not splitLine
-                    or '--' in splitLine[0] 
-                    or splitLine[0].isalpha() 
-                    or '(' in splitLine[0]):
-                line = f.readline()
-                continue
-
-            if int(splitLine[0]) > MAX_USER_ID:
-                MAX_USER_ID = int(splitLine[0])
-            line = f.readline()
-
-
-    with open(path + datFiles[0]) as f, open(path + outFiles[0], 'w') as tsvFile:
-        out = csv.writer(tsvFile, delimiter="\t")
-        # Write header
-        out.writerow(headers[outFiles[0]])
-
-        line = f.readline()
-        count = 0
-        while line:
-            l = re.sub('\s+[\|]\s+', '\t', line)
-            splitLine = l.split()
-            if (not splitLine
-                    or '--' in splitLine[0] 
-                    or splitLine[0].isalpha() 
-                    or '(' in splitLine[0]):
-                line = f.readline()
-                continue
-
-            splitLine[0] = str(int(splitLine[0]) + MAX_USER_ID)
-            out.writerow(splitLine)
-            line = f.readline()
-
-
-def processVenues():
-    print 'Processing Venues...'
-    with open(path + datFiles[1]) as f, open(path + outFiles[1], 'w') as tsvFile:
-        out = csv.writer(tsvFile, delimiter="\t")
-        # Write header
-        out.writerow(headers[outFiles[1]])
-
-        line = f.readline()
-        count = 0
-        while line:
-            l = re.sub('\s+[\|]\s+', '\t', line)
-            splitLine = l.split()
-            if (not splitLine
-                    or '--' in splitLine[0] 
-                    or splitLine[0].isalpha() 
-                    or '(' in splitLine[0]):
-                line = f.readline()
-                continue
-
-            out.writerow(splitLine)
-            line = f.readline()
+USERS, VENUES, SOCIAL_GRAPH, CHECKINS, RATINGS = range(5)
 
+# Columns holding UserIDs in each file
+userColumns = {
+        USERS: [0],
+        VENUES: [],
+        SOCIAL_GRAPH: [0, 1],
+        CHECKINS: [1],
+        RATINGS: [0],
+        }
 
-def processSocialGraph():
-    print 'Processing Social Graph...'
-    with open(path + datFiles[2]) as f, open(path + outFiles[2], 'w') as tsvFile:
-        out = csv.writer(tsvFile, delimiter="\t")
-        # Write header
-        out.writerow(headers[outFiles[2]])
+SEPARATOR = re.compile('\s+[\|]\s+')
+EMPTY_LAT_LONG = re.compile('[\|][\s]+[\|][\s]+[\|]')
+CHUNK_BYTES = 32 * 1024 * 1024
 
-        line = f.readline()
-        count = 0
-        while line:
-            l = re.sub('\s+[\|]\s+', '\t', line)
-            splitLine = l.split()
-            if (not splitLine
-                    or '--' in splitLine[0] 
-                    or '_' in splitLine[0]
-                    or splitLine[0].isalpha()   
-                    or '(' in splitLine[0]):
-                line = f.readline()
-                continue
+MAX_USER_ID = -1
 
-            splitLine[0] = str(int(splitLine[0]) + MAX_USER_ID)
-            splitLine[1] = str(int(splitLine[1]) + MAX_USER_ID)
-            out.writerow(splitLine)
+def findChunks(filename, chunkBytes=CHUNK_BYTES):
+    '''
+    Split a file into (start, end) byte ranges of about chunkBytes that
+    begin at line starts.
+    '''
+    size = os.path.getsize(filename)
+    offsets = [0]
+    with open(filename, 'rb') as f:
+        while offsets[-1] < size:
+            f.seek(min(offsets[-1] + chunkBytes, size))
+            f.readline()
+            offsets.append(min(f.tell(), size))
+    return zip(offsets[:-1], offsets[1:])
+
+def partFileName(fileIndex, chunkIndex, stage=''):
+    return '%s%s.part%s%d' % (path, outFiles[fileIndex], stage, chunkIndex)
+
+def parseChunk(fileIndex, chunkIndex, start, end, maxUserId=None):
+    '''
+    Parse the lines starting in [start, end) of a .dat file into a part
+    file. UserIDs are offset by maxUserId if given. Returns the max UserID
+    of the first column.
+    '''
+    maxId = -1
+    with open(path + datFiles[fileIndex], 'rb') as f, \
+            open(partFileName(fileIndex, chunkIndex), 'wb') as partFile:
+        out = csv.writer(partFile, delimiter="\t")
+        f.seek(start)
+        position = start
+        while position < end:
             line = f.readline()
-
-
-def processCheckins():
-    print 'Processing Checkins...'
-    with open(path + datFiles[3]) as f, open(path + outFiles[3], 'w') as tsvFile:
-        out = csv.writer(tsvFile, delimiter="\t")
-        # Write header
-        out.writerow(headers[outFiles[3]])
-
-        line = f.readline()
-        count = 0
-        while line:
-            # Replace empty Lat/Long with NULL
-            l = re.sub('[\|][\s]+[\|][\s]+[\|]', '| NULL | NULL |', line)  
-            l = re.sub('\s+[\|]\s+', '\t', l)
-
-            splitLine = l.split()
+            if not line:
+                break
+            position += len(line)
+            if fileIndex == CHECKINS:
+                # Replace empty Lat/Long with NULL
+                line = EMPTY_LAT_LONG.sub('| NULL | NULL |', line)
+            splitLine = SEPARATOR.sub('\t', line).split()
             if (not splitLine
-                    or '--' in splitLine[0] 
-                    or splitLine[0].isalpha() 
+                    or '--' in splitLine[0]
+                    or (fileIndex in (SOCIAL_GRAPH, RATINGS) and '_' in splitLine[0])
+                    or splitLine[0].isalpha()
                     or '(' in splitLine[0]):
-                line = f.readline()
                 continue
 
-            splitLine[1] = str(int(splitLine[1]) + MAX_USER_ID)
-            # Concate date
-            splitLine[5] = splitLine[5] + '_' + splitLine[6]
-            splitLine = splitLine[:6]
-
-            assert len(splitLine) == 6
+            if fileIndex == USERS:
+                maxId = max(maxId, int(splitLine[0]))
+            if maxUserId is not None:
+                for column in userColumns[fileIndex]:
+                    splitLine[column] = str(int(splitLine[column]) + maxUserId)
+            if fileIndex == CHECKINS:
+                # Concate date
+                splitLine[5] = splitLine[5] + '_' + splitLine[6]
+                splitLine = splitLine[:6]
+                assert len(splitLine) == 6
             out.writerow(splitLine)
-            line = f.readline()
-
-
-def processRatings():
-    print 'Processing Ratings...'
-    with open(path + datFiles[4]) as f, open(path + outFiles[4], 'w') as tsvFile:
+    return maxId
+
+def offsetUserPart(chunkIndex, maxUserId):
+    '''
+    Add maxUserId to the UserIDs of a users.tsv part parsed without it.
+    '''
+    partName = partFileName(USERS, chunkIndex)
+    offsetName = partFileName(USERS, chunkIndex, 'offset')
+    with open(partName, 'rb') as partFile, open(offsetName, 'wb') as offsetFile:
+        for line in partFile:
+            userId, rest = line.split('\t', 1)
+            offsetFile.write(str(int(userId) + maxUserId) + '\t' + rest)
+    os.rename(offsetName, partName)
+    return -1
+
+def runTask(task):
+    if task[0] == 'offset':
+        return offsetUserPart(*task[1:])
+    return parseChunk(*task[1:])
+
+def writeOutput(fileIndex, numChunks):
+    '''
+    Concatenate the header and part files of a .tsv file.
+    '''
+    with open(path + outFiles[fileIndex], 'wb') as tsvFile:
         out = csv.writer(tsvFile, delimiter="\t")
         # Write header
-        out.writerow(headers[outFiles[4]])
-
-        line = f.readline()
-        count = 0
-        while line:
-            l = re.sub('\s+[\|]\s+', '\t', line)
-            splitLine = l.split()
-            if (not splitLine
-                    or '--' in splitLine[0] 
-                    or '_' in splitLine[0]
-                    or splitLine[0].isalpha() 
-                    or '(' in splitLine[0]):
-                line = f.readline()
-                continue
-
-            splitLine[0] = str(int(splitLine[0]) + MAX_USER_ID)
-            out.writerow(splitLine)
-            line = f.readline()
+        out.writerow(headers[outFiles[fileIndex]])
+        for chunkIndex in range(numChunks):
+            partName = partFileName(fileIndex, chunkIndex)
+            with open(partName, 'rb') as partFile:
+                shutil.copyfileobj(partFile, tsvFile)
+            os.remove(partName)
+
+def processAll(numProcesses=None):
+    global MAX_USER_ID
+    chunks = [findChunks(path + datFile) for datFile in datFiles]
+    pool = multiprocessing.Pool(numProcesses or multiprocessing.cpu_count())
+    try:
+        print 'Processing Users and Venues...'
+        tasks = [('parse', fileIndex, chunkIndex, start, end)
+                for fileIndex in (USERS, VENUES)
+                for chunkIndex, (start, end) in enumerate(chunks[fileIndex])]
+        MAX_USER_ID = max([-1] + pool.map(runTask, tasks, chunksize=1))
+        print 'Max UserID: %d' % (MAX_USER_ID)
+
+        print 'Processing Social Graph, Checkins and Ratings...'
+        tasks = [('offset', chunkIndex, MAX_USER_ID) for chunkIndex in range(len(chunks[USERS]))]
+        tasks += [('parse', fileIndex, chunkIndex, start, end, MAX_USER_ID)
+                for fileIndex in (SOCIAL_GRAPH, CHECKINS, RATINGS)
+                for chunkIndex, (start, end) in enumerate(chunks[fileIndex])]
+        pool.map(runTask, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    for fileIndex in range(len(datFiles)):
+        writeOutput(fileIndex, len(chunks[fileIndex]))
 
 
 def main():
@@ -200,11 +192,8 @@ def main():
     """
     userInput = raw_input(warning)
     if userInput == 'y' or userInput == 'Y' or userInput == 'yes' or userInput == 'Yes':
-        processUsers()
-        processVenues()
-        processSocialGraph()
-        processCheckins()
-        processRatings()
+        numProcesses = int(sys.argv[1]) if len(sys.argv) > 1 else None
+        processAll(numProcesses)
 
 if __name__ == '__main__':
         main()
@@ -8,6 +8,14 @@ We are truncated our original dataset by removing checkins where the user has
 only a single checkin.
 
 Output: File checkinsTrunc.txt, the truncated list of checkins.txt
+
+The default streaming mode runs in bounded memory: checkins are read in
+chunks and spread over bucket files by user id, as binary int64 pairs, so
+that every user's checkins land in the same bucket. Each bucket is then
+filtered on its own and its qualifying checkins are appended to the output,
+and the user and venue ids are collected as sorted integer arrays, saved
+as .npy files.
+remove_single_checkins() is the original in-memory version.
 """
 
 # Original number of unique users: 485381
@@ -15,7 +23,14 @@ Output: File checkinsTrunc.txt, the truncated list of checkins.txt
 # Max user id: 2153502
 # Min venue id: 2153503
 
-import cPickle as pickle
+import itertools
+import os
+import shutil
+import tempfile
+import numpy as np
+
+NUM_BUCKETS = 64
+CHUNK_LINES = 1 << 20
 
 def remove_single_checkins(filename):
     user_checkin_venues = {}
@@ -42,6 +57,74 @@ def remove_single_checkins(filename):
     return user_venue_pairs
             
 
+def read_chunks(filename, chunk_lines=CHUNK_LINES):
+    """
+    Yield (num checkins x 2) int64 arrays of (user, venue) of up to
+    chunk_lines checkins.
+    """
+    with open(filename, 'r') as checkins:
+        while True:
+            lines = list(itertools.islice(checkins, chunk_lines))
+            if not lines:
+                break
+            yield np.loadtxt(lines, dtype=np.int64, usecols=(0, 1), ndmin=2)
+
+
+def split_into_buckets(filename, bucket_dir, num_buckets=NUM_BUCKETS):
+    """
+    Append every checkin to bucket file (user id % num_buckets) in
+    bucket_dir, keeping the order of the input.
+    """
+    files = [open(bucket_filename(bucket_dir, i), 'wb') for i in range(num_buckets)]
+    try:
+        for pairs in read_chunks(filename):
+            buckets = pairs[:, 0] % num_buckets
+            order = np.argsort(buckets, kind='mergesort')
+            bounds = np.searchsorted(buckets[order], np.arange(num_buckets + 1))
+            for i in range(num_buckets):
+                pairs[order[bounds[i]:bounds[i + 1]]].tofile(files[i])
+    finally:
+        for file in files:
+            file.close()
+
+
+def bucket_filename(bucket_dir, i):
+    return os.path.join(bucket_dir, 'bucket{}.bin'.format(i))
+
+
+def filter_bucket(pairs):
+    """
+    Keep the checkins of the users with more than one distinct venue.
+    """
+    distinct = np.unique(pairs, axis=0)
+    users, num_venues = np.unique(distinct[:, 0], return_counts=True)
+    return pairs[np.isin(pairs[:, 0], users[num_venues > 1])]
+
+
+def remove_single_checkins_streaming(filename, outfile, num_buckets=NUM_BUCKETS):
+    """
+    Streaming version of remove_single_checkins() + output_data(). Returns
+    the sorted user ids and venue ids of the written checkins.
+    """
+    bucket_dir = tempfile.mkdtemp(dir=os.path.dirname(outfile) or '.')
+    user_ids = []
+    venue_ids = np.zeros(0, dtype=np.int64)
+    try:
+        split_into_buckets(filename, bucket_dir, num_buckets)
+        with open(outfile, 'w') as checkins:
+            for i in range(num_buckets):
+                pairs = np.fromfile(bucket_filename(bucket_dir, i), dtype=np.int64).reshape(-1, 2)
+                os.remove(bucket_filename(bucket_dir, i))
+                pairs = filter_bucket(pairs)
+                np.savetxt(checkins, pairs, fmt='%d\t%d')
+                user_ids.append(np.unique(pairs[:, 0]))
+                venue_ids = np.union1d(venue_ids, pairs[:, 1])
+    finally:
+        shutil.rmtree(bucket_dir)
+    # Buckets hold disjoint users
+    return np.sort(np.concatenate(user_ids)), venue_ids
+
+
 def output_data(filename, user_venue_pairs):
     with open(filename, 'w') as checkins:
         for pair in user_venue_pairs:
@@ -50,26 +133,28 @@ def output_data(filename, user_venue_pairs):
 
 
 
-def write_pickles(pickle_users, pickle_venues, users_venues):
-    users, venues = zip(*users_venues)
-    users_set, venues_set = set(users), set(venues)
-    assert len(users) == len(venues)
-    with open(pickle_users, 'w') as file:
-        pickle.dump(users_set, file, protocol=pickle.HIGHEST_PROTOCOL)
-    with open(pickle_venues, 'w') as file:
-        pickle.dump(venues_set, file, protocol=pickle.HIGHEST_PROTOCOL)
+def write_ids(users_file, venues_file, users_venues):
+    """
+    Save the user and venue ids of (user, venue) pairs as sorted arrays.
+    """
+    pairs = np.array(users_venues, dtype=np.int64).reshape(-1, 2)
+    write_id_arrays(users_file, venues_file, np.unique(pairs[:, 0]), np.unique(pairs[:, 1]))
+
+
+def write_id_arrays(users_file, venues_file, user_ids, venue_ids):
+    np.save(users_file, user_ids)
+    np.save(venues_file, venue_ids)
 
 
 def main():
     path = 'code/'
     infile = 'checkins.txt'
     outfile = 'checkinsTrunc.txt'
-    pickle_users = 'user_ids_trunc.pickle'
-    pickle_venues = 'venue_ids_trunc.pickle'
+    users_array = 'user_ids_trunc.npy'
+    venues_array = 'venue_ids_trunc.npy'
 
-    checkinsTrunc = remove_single_checkins(path + infile)
-    output_data(path + outfile, checkinsTrunc)
-    write_pickles(path + pickle_users, path + pickle_venues, checkinsTrunc)
+    user_ids, venue_ids = remove_single_checkins_streaming(path + infile, path + outfile)
+    write_id_arrays(path + users_array, path + venues_array, user_ids, venue_ids)
 
 
 if __name__ == '__main__':